@@ -6,16 +6,39 @@ from dotenv import load_dotenv
 import asyncio
 from aiohttp import web
 import json
-from datetime import datetime, timedelta, timezone
-
-# Try to import pytz for proper timezone handling, fallback to basic timezone if not available
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import csv
+import io
+import heapq
+import itertools
+import mmap
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# pytz is optional, only used when the system has no IANA timezone data
 try:
     import pytz
     PYTZ_AVAILABLE = True
-    print("✅ Pytz loaded - Full timezone support enabled")
 except ImportError:
     PYTZ_AVAILABLE = False
-    print("⚠️ Pytz not available - Using basic timezone handling")
+
+# NumPy speeds up batched TP/SL level computation but is optional
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+    print("✅ NumPy loaded - Vectorized level computation enabled")
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("⚠️ NumPy not available - Using pure Python level computation")
 
 # Telegram integration
 try:
@@ -47,7 +70,7 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True  # Required for member join events
 
-# Auto-role system storage with weekend handling
+# Auto-role defaults with weekend handling (each guild gets its own copy)
 AUTO_ROLE_CONFIG = {
     "enabled": False,
     "role_id": None,
@@ -55,27 +78,2301 @@ AUTO_ROLE_CONFIG = {
     "custom_message":
     "Hey! Your **24-hour free access** to the <#1350929852299214999> channel has unfortunately **ran out**. We truly hope you were able to benefit with us & we hope to see you back soon! For now, feel free to continue following our trade signals in ⁠<#1350929790148022324>",
     "active_members":
-    {},  # member_id: {"role_added_time": datetime, "role_id": role_id, "weekend_delayed": bool}
+    {},  # member_id: TrackedMember
     "weekend_pending": {
     }  # member_id: {"join_time": datetime, "guild_id": guild_id} for weekend joiners
 }
 
+# Per-guild auto-role configuration and tracking, shaped like AUTO_ROLE_CONFIG.
+# Tracked members are addressed by (guild_id, member_id) keys everywhere else.
+GUILD_AUTO_ROLE_CONFIGS = {}  # guild_id: config
+LEGACY_GUILD_ID = 0  # settings saved before per-guild configs, adopted on load
+
+# Sharding: leave unset to let AutoShardedBot run every shard in this process
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if os.getenv("SHARD_COUNT") else None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",")
+             if shard_id.strip()] or None
+if SHARD_IDS is not None and (
+        SHARD_COUNT is None or any(not 0 <= shard_id < SHARD_COUNT for shard_id in SHARD_IDS)):
+    # Running every shard here would duplicate the events of the other processes
+    print("❌ SHARD_IDS needs SHARD_COUNT set, with every ID below it "
+          "(e.g. SHARD_COUNT=4 SHARD_IDS=0,1)")
+    sys.exit(1)
+
+# Auto-role state storage (SQLite in WAL mode, migrated once from the old JSON file)
+AUTO_ROLE_DB_PATH = os.getenv("AUTO_ROLE_DB_PATH", "auto_role_state.db")
+AUTO_ROLE_JSON_PATH = "auto_role_config.json"
+AUTO_ROLE_SETTING_KEYS = ("enabled", "role_id", "duration_hours",
+                          "custom_message", "weekend_pending")
+AUTO_ROLE_FLUSH_INTERVAL = float(os.getenv("AUTO_ROLE_FLUSH_INTERVAL",
+                                           "2"))  # seconds between flushes
+
+# Signal ledger: every /entry with its levels and sent message IDs (SQLite, WAL)
+SIGNAL_LEDGER_DB_PATH = os.getenv("SIGNAL_LEDGER_DB_PATH", "signal_ledger.db")
+
+# Outcome tracker price feed: "csv:<path>", "ndjson:<path>" or "socket:<host>:<port>"
+# (unset disables automatic TP/SL tracking)
+PRICE_FEED = os.getenv("PRICE_FEED", "")
+OUTCOME_POLL_INTERVAL = 5  # seconds between ledger polls for new signals
+
+# History indexer: channel IDs whose bot signal/stats messages are indexed into the
+# ledger (comma-separated, unset disables it), how often to tail them and how far
+# back the first run backfills
+HISTORY_INDEX_CHANNELS = [
+    int(channel_id) for channel_id in os.getenv("HISTORY_INDEX_CHANNELS", "").split(",")
+    if channel_id.strip()
+]
+HISTORY_INDEX_INTERVAL_MINUTES = float(os.getenv("HISTORY_INDEX_INTERVAL_MINUTES", "30"))
+HISTORY_INDEX_BACKFILL_DAYS = int(os.getenv("HISTORY_INDEX_BACKFILL_DAYS", "365"))
+
+# Backtest mode: price rows replayed per memory-mapped chunk
+BACKTEST_CHUNK_ROWS = int(os.getenv("BACKTEST_CHUNK_ROWS", "1000000"))
+
+# Join pipeline: number of joins processed concurrently (role grant + welcome DM)
+JOIN_WORKER_CONCURRENCY = int(os.getenv("JOIN_WORKER_CONCURRENCY", "4"))
+
+# DM outbox: delivery pace and retry policy for queued member DMs
+DM_OUTBOX_RATE = float(os.getenv("DM_OUTBOX_RATE", "2"))  # DMs per second
+DM_OUTBOX_CONCURRENCY = int(os.getenv("DM_OUTBOX_CONCURRENCY", "2"))
+DM_OUTBOX_MAX_ATTEMPTS = int(os.getenv("DM_OUTBOX_MAX_ATTEMPTS", "6"))
+DM_OUTBOX_BASE_BACKOFF = 30  # seconds, doubled on every failed attempt
+DM_OUTBOX_MAX_BACKOFF = 3600
+DM_OUTBOX_CLAIM_LEASE = 300  # seconds a process holds claimed rows before others may retry them
+
+# Role expiry: REST budget for removals so a large cohort is spread out instead of hitting 429s
+ROLE_REST_RATE = float(os.getenv("ROLE_REST_RATE", "2"))  # role removals per second
+ROLE_REST_BURST = int(os.getenv("ROLE_REST_BURST", "5"))
+EXPIRY_CONCURRENCY = int(os.getenv("EXPIRY_CONCURRENCY", "4"))  # removals in flight
+
+# Startup reconcile: give auto-role holders the bot never tracked a fresh countdown
+# (off by default, they are only reported)
+RECONCILE_ADOPT_UNTRACKED = os.getenv("RECONCILE_ADOPT_UNTRACKED", "").lower() in ("1", "true", "yes")
+
+# Bulk /timedautorole import: role grants share the expiry REST budget
+BULK_IMPORT_CONCURRENCY = int(os.getenv("BULK_IMPORT_CONCURRENCY", "4"))
+BULK_IMPORT_MAX_ROWS = 5000
+BULK_IMPORT_MAX_BYTES = 512 * 1024
+BULK_IMPORT_PROGRESS_INTERVAL = 2  # seconds between progress message edits
+
+# /entry and /stats fan-out: Discord allows about 5 messages per 5 seconds per channel
+BROADCAST_CHANNEL_RATE = 1.0  # messages per second per channel
+BROADCAST_CHANNEL_BURST = 5
+
+# Monday activation: weekend joiners are notified once when the markets open
+MONDAY_ACTIVATION_WINDOW_HOURS = 2  # catch-up window after a restart (00:00-01:59)
+MONDAY_ACTIVATION_MESSAGE = (
+    "Hey! The weekend is over and the markets are now open. "
+    "That means your 24-hour welcome gift has officially started. "
+    "You now have full access to the premium channel. "
+    "Let's make the most of it by securing some wins together!")
+
+# /timedautorole list pagination
+AUTO_ROLE_LIST_PAGE_SIZE = 20
+AUTO_ROLE_LIST_KINDS = ("24hours", "weekend", "custom")
+
+# Market calendar: sessions run Monday 00:00 to Friday 12:00 (Amsterdam time)
+MARKET_WEEKLY_CLOSE = (4, 12)  # weekday, hour
+MARKET_HOLIDAYS = os.getenv("MARKET_HOLIDAYS", "")  # "2026-12-25,2027-01-01"
+MARKET_EARLY_CLOSES = os.getenv("MARKET_EARLY_CLOSES",
+                                "")  # "2026-12-24 17:00,2026-12-31 17:00"
+MARKET_CALENDAR_HORIZON_DAYS = int(
+    os.getenv("MARKET_CALENDAR_HORIZON_DAYS", "120"))
+
+
+class CentralEuropeanTime(tzinfo):
+    """Europe/Amsterdam offsets (CET/CEST) for systems without timezone data"""
+
+    @staticmethod
+    def _summer_time_utc(year):
+        """Naive UTC instants summer time starts and ends (last Sunday of March/October, 01:00)"""
+        bounds = []
+        for month in (3, 10):
+            last_day = datetime(year, month, 31, 1)
+            bounds.append(last_day - timedelta(days=(last_day.weekday() + 1) % 7))
+        return bounds
+
+    def utcoffset(self, dt):
+        if dt is None:
+            return timedelta(hours=1)
+        start, end = self._summer_time_utc(dt.year)
+        local = dt.replace(tzinfo=None)
+        if start + timedelta(hours=1) <= local < end + timedelta(hours=1):
+            return timedelta(hours=2)
+        if end + timedelta(hours=1) <= local < end + timedelta(hours=2):
+            # 02:00-02:59 happens twice in October, fold=1 is the second (winter) pass
+            return timedelta(hours=1 if dt.fold else 2)
+        return timedelta(hours=1)
+
+    def dst(self, dt):
+        return self.utcoffset(dt) - timedelta(hours=1)
+
+    def tzname(self, dt):
+        return "CEST" if self.dst(dt) else "CET"
+
+    def fromutc(self, dt):
+        utc = dt.replace(tzinfo=None)
+        start, end = self._summer_time_utc(utc.year)
+        if start <= utc < end:
+            return (utc + timedelta(hours=2)).replace(tzinfo=self)
+        fold = 1 if end <= utc < end + timedelta(hours=1) else 0
+        return (utc + timedelta(hours=1)).replace(tzinfo=self, fold=fold)
+
+
 # Amsterdam timezone handling with fallback
-if PYTZ_AVAILABLE:
-    AMSTERDAM_TZ = pytz.timezone(
-        'Europe/Amsterdam')  # Proper Amsterdam timezone with DST support
-else:
-    # Fallback: Use UTC+1 (CET) as approximation
-    AMSTERDAM_TZ = timezone(
-        timedelta(hours=1))  # Basic Amsterdam timezone without DST
+try:
+    AMSTERDAM_TZ = ZoneInfo("Europe/Amsterdam")
+    print("✅ Timezone data loaded - Full timezone support enabled")
+except ZoneInfoNotFoundError:
+    if PYTZ_AVAILABLE:
+        AMSTERDAM_TZ = pytz.timezone('Europe/Amsterdam')
+        print("✅ Pytz loaded - Full timezone support enabled")
+    else:
+        AMSTERDAM_TZ = CentralEuropeanTime()  # Built-in EU summer time rules
+        print("⚠️ No timezone data found - Using built-in CET/CEST rules")
+
+
+def localize_amsterdam(dt):
+    """Return the given datetime as an aware Amsterdam datetime"""
+    if dt.tzinfo is None:
+        if hasattr(AMSTERDAM_TZ, "localize"):  # pytz
+            return AMSTERDAM_TZ.localize(dt)
+        return dt.replace(tzinfo=AMSTERDAM_TZ)
+    return dt.astimezone(AMSTERDAM_TZ)
+
+
+class MarketCalendar:
+    """Precomputed market sessions over a rolling horizon with O(log n) lookups
+
+    Session open/close instants are computed once per horizon from local
+    Amsterdam dates, so DST changes, holidays and early closes are baked into
+    the table instead of being recomputed on every call.
+    """
+
+    def __init__(self, holidays=(), early_closes=None,
+                 horizon_days=MARKET_CALENDAR_HORIZON_DAYS):
+        self.holidays = set(holidays)
+        self.early_closes = dict(early_closes or {})  # date: (hour, minute)
+        self.horizon_days = max(14, horizon_days)
+        self._opens = []  # session open timestamps, ascending
+        self._closes = []  # matching close timestamps
+        self._start_ts = self._end_ts = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a calendar from MARKET_HOLIDAYS and MARKET_EARLY_CLOSES"""
+        holidays = set()
+        for value in MARKET_HOLIDAYS.split(","):
+            if value.strip():
+                try:
+                    holidays.add(date.fromisoformat(value.strip()))
+                except ValueError:
+                    print(f"⚠️ Ignoring invalid market holiday: {value}")
 
+        early_closes = {}
+        for value in MARKET_EARLY_CLOSES.split(","):
+            if value.strip():
+                try:
+                    close_time = datetime.strptime(value.strip(),
+                                                   "%Y-%m-%d %H:%M")
+                    early_closes[close_time.date()] = (close_time.hour,
+                                                       close_time.minute)
+                except ValueError:
+                    print(f"⚠️ Ignoring invalid market early close: {value}")
+
+        return cls(holidays, early_closes)
+
+    @staticmethod
+    def _local_timestamp(day, hour=0, minute=0):
+        return localize_amsterdam(
+            datetime(day.year, day.month, day.day, hour, minute)).timestamp()
+
+    @staticmethod
+    def _timestamp(dt):
+        if dt is None:
+            return time.time()
+        return localize_amsterdam(dt).timestamp()
+
+    def _build(self, first_day):
+        """Compute the session table from first_day over the horizon"""
+        opens, closes = [], []
+        for offset in range(self.horizon_days):
+            day = first_day + timedelta(days=offset)
+            if day.weekday() >= 5 or day in self.holidays:
+                continue
+
+            open_ts = self._local_timestamp(day)
+            if day in self.early_closes:
+                close_ts = self._local_timestamp(day, *self.early_closes[day])
+            elif day.weekday() == MARKET_WEEKLY_CLOSE[0]:
+                close_ts = self._local_timestamp(day, MARKET_WEEKLY_CLOSE[1])
+            else:
+                close_ts = self._local_timestamp(day + timedelta(days=1))
 
-class TradingBot(commands.Bot):
+            # Consecutive trading days form one continuous session
+            if closes and closes[-1] == open_ts:
+                closes[-1] = close_ts
+            else:
+                opens.append(open_ts)
+                closes.append(close_ts)
+
+        self._opens, self._closes = opens, closes
+        self._start_ts = self._local_timestamp(first_day)
+        self._end_ts = self._local_timestamp(
+            first_day + timedelta(days=self.horizon_days))
+
+    def _ensure(self, ts):
+        """Roll the horizon forward (or back) when ts gets near its edges"""
+        margin = self.horizon_days // 3 * 86400
+        if self._start_ts is None or not (self._start_ts <= ts <=
+                                          self._end_ts - margin):
+            day = datetime.fromtimestamp(ts, AMSTERDAM_TZ).date()
+            self._build(day - timedelta(days=7))
+
+    def _session_index(self, ts):
+        self._ensure(ts)
+        return bisect.bisect_right(self._opens, ts) - 1
+
+    def is_open(self, dt=None):
+        """Whether the market is open at the given datetime (or now)"""
+        ts = self._timestamp(dt)
+        index = self._session_index(ts)
+        return index >= 0 and ts < self._closes[index]
+
+    def session_open(self, dt=None):
+        """Open time of the session running at dt (or now), None while closed"""
+        ts = self._timestamp(dt)
+        index = self._session_index(ts)
+        if index < 0 or ts >= self._closes[index]:
+            return None
+        return datetime.fromtimestamp(self._opens[index], AMSTERDAM_TZ)
+
+    def next_open(self, dt=None):
+        """Start of the next session opening after dt (or now)"""
+        ts = self._timestamp(dt)
+        index = self._session_index(ts) + 1
+        if index >= len(self._opens):
+            raise ValueError("No market session within the calendar horizon")
+        return datetime.fromtimestamp(self._opens[index], AMSTERDAM_TZ)
+
+
+def get_auto_role_config(guild_id):
+    """Get the auto-role configuration of a guild, creating it from the defaults"""
+    config = GUILD_AUTO_ROLE_CONFIGS.get(guild_id)
+    if config is None:
+        config = json.loads(json.dumps(AUTO_ROLE_CONFIG))  # deep copy
+        GUILD_AUTO_ROLE_CONFIGS[guild_id] = config
+    return config
+
+
+def is_auto_role_enabled(guild_id):
+    config = GUILD_AUTO_ROLE_CONFIGS.get(guild_id)
+    return bool(config and config["enabled"] and config["role_id"])
+
+
+def get_tracked_member(key):
+    """Get the tracking data of a (guild_id, member_id) key, or None"""
+    guild_id, member_id = key
+    config = GUILD_AUTO_ROLE_CONFIGS.get(guild_id)
+    return config["active_members"].get(member_id) if config else None
+
+
+def parse_member_expiry_time(data):
+    """Get the absolute expiry time of a tracked auto-role member"""
+    if data.get("weekend_delayed", False) and "expiry_time" in data:
+        # Weekend joiners and custom durations have a specific expiry time
+        return localize_amsterdam(datetime.fromisoformat(data["expiry_time"]))
+
+    # Normal members - 24 hours from role_added_time (absolute, also across DST)
+    role_added_time = localize_amsterdam(
+        datetime.fromisoformat(data["role_added_time"]))
+    return datetime.fromtimestamp(role_added_time.timestamp() + 24 * 3600,
+                                  AMSTERDAM_TZ)
+
+
+class TrackedMember:
+    """Compact tracking record of an auto-role member, times as epoch seconds
+
+    Expiry is parsed once when the record is created; to_dict/from_dict keep
+    the JSON layout used in the state store.
+    """
+
+    __slots__ = ("guild_id", "role_id", "added_ts", "expiry_ts", "flags")
+
+    WEEKEND = 1  # countdown waits for the market open ("weekend_delayed")
+    CUSTOM = 2  # manually added with a custom duration
+    NOTIFIED = 4  # Monday activation DM already queued
+
+    def __init__(self, guild_id, role_id, added_ts, expiry_ts, flags=0):
+        self.guild_id = guild_id
+        self.role_id = role_id
+        self.added_ts = int(added_ts)
+        self.expiry_ts = int(expiry_ts)
+        self.flags = flags
+
+    @property
+    def weekend_delayed(self):
+        return bool(self.flags & self.WEEKEND)
+
+    @property
+    def custom_duration(self):
+        return bool(self.flags & self.CUSTOM)
+
+    @property
+    def monday_notification_sent(self):
+        return bool(self.flags & self.NOTIFIED)
+
+    def expiry_time(self):
+        return datetime.fromtimestamp(self.expiry_ts, AMSTERDAM_TZ)
+
+    def with_flags(self, flags):
+        """Copy of this record with extra flags set (records are never mutated)"""
+        return TrackedMember(self.guild_id, self.role_id, self.added_ts,
+                             self.expiry_ts, self.flags | flags)
+
+    @classmethod
+    def from_dict(cls, data, guild_id=None):
+        flags = 0
+        if data.get("weekend_delayed", False) and "expiry_time" in data:
+            flags |= cls.WEEKEND
+        if data.get("custom_duration", False):
+            flags |= cls.CUSTOM
+        if data.get("monday_notification_sent", False):
+            flags |= cls.NOTIFIED
+        added_time = localize_amsterdam(
+            datetime.fromisoformat(data["role_added_time"]))
+        return cls(data.get("guild_id") or guild_id, data.get("role_id"),
+                   added_time.timestamp(),
+                   parse_member_expiry_time(data).timestamp(), flags)
+
+    def to_dict(self):
+        data = {
+            "role_added_time":
+            datetime.fromtimestamp(self.added_ts, AMSTERDAM_TZ).isoformat(),
+            "role_id": self.role_id,
+            "guild_id": self.guild_id,
+            "weekend_delayed": self.weekend_delayed
+        }
+        if self.weekend_delayed:
+            data["expiry_time"] = self.expiry_time().isoformat()
+        if self.custom_duration:
+            data["custom_duration"] = True
+        if self.monday_notification_sent:
+            data["monday_notification_sent"] = True
+        return data
+
+
+class ExpiryScheduler:
+    """Min-heap of member expiry deadlines that sleeps until the next one is due"""
 
     def __init__(self):
-        super().__init__(command_prefix='!', intents=intents)
+        self._heap = []  # (deadline timestamp, (guild_id, member_id))
+        self._deadlines = {}  # (guild_id, member_id): deadline currently scheduled
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key, deadline):
+        """Schedule (or reschedule) a member to expire at the given timestamp"""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+
+        # Wake the waiter early if this is now the earliest deadline
+        if self._heap[0] == (deadline, key):
+            self._wakeup.set()
+
+        # Compact the heap when cancelled/rescheduled entries pile up
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, m) for m, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+    def cancel(self, key):
+        """Drop a member from the schedule (stale heap entries are skipped lazily)"""
+        self._deadlines.pop(key, None)
+
+    def clear(self):
+        self._heap.clear()
+        self._deadlines.clear()
+        self._wakeup.set()
+
+    def _discard_stale(self):
+        while self._heap:
+            deadline, key = self._heap[0]
+            if self._deadlines.get(key) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        """Timestamp of the earliest scheduled expiry, or None"""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now_ts=None):
+        """Remove and return every member whose deadline has passed"""
+        if now_ts is None:
+            now_ts = time.time()
+
+        due = []
+        self._discard_stale()
+        while self._heap and self._heap[0][0] <= now_ts:
+            deadline, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+            self._discard_stale()
+        return due
+
+    async def wait_until_due(self):
+        """Sleep until the earliest deadline passes, waking early on schedule changes"""
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    return
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+def member_expiry_kind(data):
+    """List filter a tracked member falls under: 24hours, weekend or custom"""
+    if data.custom_duration:
+        return "custom"
+    if data.weekend_delayed:
+        return "weekend"
+    return "24hours"
+
+
+class ExpiryIndex:
+    """Per-guild member lists sorted by expiry, with one list per timing kind"""
+
+    def __init__(self):
+        self._lists = {}  # (guild_id, kind or None): sorted [(expiry_ts, member_id)]
+        self._entries = {}  # (guild_id, member_id): (expiry_ts, kind)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, key, expiry_ts, kind):
+        """Insert or move a member to its current expiry"""
+        self.remove(key)
+        guild_id, member_id = key
+        self._entries[key] = (expiry_ts, kind)
+        for list_key in ((guild_id, None), (guild_id, kind)):
+            bisect.insort(self._lists.setdefault(list_key, []),
+                          (expiry_ts, member_id))
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        expiry_ts, kind = entry
+        guild_id, member_id = key
+        for list_key in ((guild_id, None), (guild_id, kind)):
+            entries = self._lists[list_key]
+            del entries[bisect.bisect_left(entries, (expiry_ts, member_id))]
+
+    def clear(self):
+        self._lists.clear()
+        self._entries.clear()
+
+    def _upcoming(self, guild_id, kind, now_ts):
+        entries = self._lists.get((guild_id, kind), [])
+        return entries, bisect.bisect_right(entries, (now_ts, "\uffff"))
+
+    def count(self, guild_id, kind=None, now_ts=None):
+        """Number of members that have not expired yet"""
+        entries, start = self._upcoming(guild_id, kind,
+                                        time.time() if now_ts is None else now_ts)
+        return len(entries) - start
+
+    def page(self, guild_id, kind=None, page=0, size=AUTO_ROLE_LIST_PAGE_SIZE,
+             now_ts=None):
+        """(expiry_ts, member_id) pairs of one page, soonest expiry first"""
+        entries, start = self._upcoming(guild_id, kind,
+                                        time.time() if now_ts is None else now_ts)
+        start += page * size
+        return entries[start:start + size]
+
+
+class AutoRoleStore:
+    """SQLite (WAL) storage for auto-role settings and tracked members
+
+    Every method is blocking and meant to be called through asyncio.to_thread
+    so that disk access never runs on the event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Open the database, create the schema and migrate the JSON file once"""
+        with self._lock:
+            if self._conn is not None:
+                return
+
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Writes are coalesced by WriteBehindPersister, so fsync every commit
+            conn.execute("PRAGMA synchronous=FULL")
+            with conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS guild_settings (
+                        guild_id INTEGER NOT NULL,
+                        key TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        PRIMARY KEY (guild_id, key))""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS tracked_members (
+                        guild_id INTEGER NOT NULL,
+                        member_id TEXT NOT NULL,
+                        expiry_ts REAL,
+                        data TEXT NOT NULL,
+                        PRIMARY KEY (guild_id, member_id))""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS idx_tracked_members_expiry
+                        ON tracked_members (expiry_ts)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS dm_outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER NOT NULL,
+                        kind TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        next_attempt_ts REAL NOT NULL,
+                        claimed_until REAL,
+                        last_error TEXT,
+                        created_ts REAL NOT NULL)""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS idx_dm_outbox_next_attempt
+                        ON dm_outbox (next_attempt_ts)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS dm_dead_letters (
+                        id INTEGER PRIMARY KEY,
+                        user_id INTEGER NOT NULL,
+                        kind TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        attempts INTEGER NOT NULL,
+                        error TEXT,
+                        failed_ts REAL NOT NULL)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS dm_blocked_recipients (
+                        user_id INTEGER PRIMARY KEY,
+                        reason TEXT,
+                        blocked_ts REAL NOT NULL)""")
+            self._conn = conn
+
+            self._migrate_from_json()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _migrate_from_json(self):
+        """Import auto_role_config.json into an empty database (runs once)"""
+        if not os.path.exists(AUTO_ROLE_JSON_PATH):
+            return
+
+        has_rows = self._conn.execute(
+            "SELECT 1 FROM guild_settings UNION ALL SELECT 1 FROM tracked_members LIMIT 1"
+        ).fetchone()
+        if has_rows:
+            return
+
+        with open(AUTO_ROLE_JSON_PATH, "r") as f:
+            legacy_config = json.load(f)
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?)",
+                [(LEGACY_GUILD_ID, key, json.dumps(legacy_config[key]))
+                 for key in AUTO_ROLE_SETTING_KEYS if key in legacy_config])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracked_members (guild_id, member_id, expiry_ts, data) "
+                "VALUES (?, ?, ?, ?)",
+                [self._member_row((data.get("guild_id") or LEGACY_GUILD_ID, member_id), data)
+                 for member_id, data in legacy_config.get("active_members", {}).items()])
+
+        os.replace(AUTO_ROLE_JSON_PATH, AUTO_ROLE_JSON_PATH + ".migrated")
+        print(
+            f"✅ Migrated {len(legacy_config.get('active_members', {}))} tracked member(s) from {AUTO_ROLE_JSON_PATH}"
+        )
+
+    @staticmethod
+    def _member_row(key, data):
+        guild_id, member_id = key
+        if isinstance(data, dict):  # JSON layout from the migration paths
+            try:
+                data = TrackedMember.from_dict(data, guild_id)
+            except Exception:
+                # Corrupted entries are expired on load
+                return (guild_id, str(member_id), None, json.dumps(data))
+        return (guild_id, str(member_id), data.expiry_ts,
+                json.dumps(data.to_dict()))
+
+    @staticmethod
+    def _shard_filter(shard_count, shard_ids):
+        """SQL condition limiting rows to the guilds of this process's shards"""
+        if not shard_count or shard_ids is None:
+            return "1 = 1", ()
+        placeholders = ", ".join("?" for _ in shard_ids)
+        return (f"(guild_id = ? OR ((guild_id >> 22) % ?) IN ({placeholders}))",
+                (LEGACY_GUILD_ID, shard_count, *shard_ids))
+
+    def load(self, shard_count=None, shard_ids=None):
+        """Return {guild_id: settings} and {guild_id: {member_id: TrackedMember}} for this process's shards"""
+        condition, params = self._shard_filter(shard_count, shard_ids)
+        settings = collections.defaultdict(dict)
+        active_members = collections.defaultdict(dict)
+        with self._lock:
+            for guild_id, key, value in self._conn.execute(
+                    f"SELECT guild_id, key, value FROM guild_settings WHERE {condition}",
+                    params):
+                settings[guild_id][key] = json.loads(value)
+            for guild_id, member_id, data in self._conn.execute(
+                    f"SELECT guild_id, member_id, data FROM tracked_members WHERE {condition} "
+                    "ORDER BY expiry_ts", params):
+                try:
+                    record = TrackedMember.from_dict(json.loads(data), guild_id)
+                except Exception as e:
+                    print(f"❌ Error processing member {member_id}: {str(e)}")
+                    # Expire corrupted entries right away so they get cleaned up
+                    record = TrackedMember(guild_id, None, 0, 0)
+                active_members[guild_id][member_id] = record
+        return dict(settings), dict(active_members)
+
+    def adopt_legacy_settings(self, guild_id):
+        """Move the pre-partitioning settings (and stray members) to their guild"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO guild_settings (guild_id, key, value) "
+                "SELECT ?, key, value FROM guild_settings WHERE guild_id = ?",
+                (guild_id, LEGACY_GUILD_ID))
+            self._conn.execute("DELETE FROM guild_settings WHERE guild_id = ?",
+                               (LEGACY_GUILD_ID, ))
+            self._conn.execute(
+                "UPDATE OR IGNORE tracked_members SET guild_id = ? WHERE guild_id = ?",
+                (guild_id, LEGACY_GUILD_ID))
+
+    def apply_batch(self, upserts, deletes, settings=None, dm_messages=(),
+                    dm_cancellations=()):
+        """Write member upserts/deletes, guild settings and queued DMs in one transaction
+
+        upserts maps (guild_id, member_id) keys to member data, deletes is an
+        iterable of keys and settings maps guild_id to that guild's settings.
+        dm_cancellations lists user ids whose pending outbox DMs are dropped
+        before dm_messages are inserted.
+        """
+        member_rows = [
+            self._member_row(key, data) for key, data in upserts.items()
+        ]
+        with self._lock, self._conn:
+            now_ts = time.time()
+            self._conn.executemany("DELETE FROM dm_outbox WHERE user_id = ?",
+                                   [(user_id, ) for user_id in dm_cancellations])
+            self._conn.executemany(
+                "INSERT INTO dm_outbox (user_id, kind, content, next_attempt_ts, created_ts) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(user_id, kind, content, now_ts, now_ts)
+                 for user_id, kind, content in dm_messages])
+            for guild_id, guild_settings in (settings or {}).items():
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?)",
+                    [(guild_id, key, json.dumps(value))
+                     for key, value in guild_settings.items()])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracked_members (guild_id, member_id, expiry_ts, data) "
+                "VALUES (?, ?, ?, ?)", member_rows)
+            self._conn.executemany(
+                "DELETE FROM tracked_members WHERE guild_id = ? AND member_id = ?",
+                [(guild_id, str(member_id)) for guild_id, member_id in deletes])
+
+    def claim_due_dms(self, now_ts, limit, lease):
+        """Claim outbox rows ready for delivery, oldest first
+
+        Processes sharing the database each claim their own rows for `lease`
+        seconds; rows of a process that died are picked up once it runs out.
+        """
+        with self._lock, self._conn:
+            # Take the write lock up front so two processes never claim the same rows
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT id, user_id, kind, content, attempts FROM dm_outbox "
+                "WHERE next_attempt_ts <= ? AND COALESCE(claimed_until, 0) <= ? "
+                "ORDER BY next_attempt_ts LIMIT ?",
+                (now_ts, now_ts, limit)).fetchall()
+            self._conn.executemany(
+                "UPDATE dm_outbox SET claimed_until = ? WHERE id = ?",
+                [(now_ts + lease, row[0]) for row in rows])
+        return rows
+
+    def next_dm_due(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(MAX(next_attempt_ts, COALESCE(claimed_until, 0))) "
+                "FROM dm_outbox").fetchone()
+        return row[0]
+
+    def dm_outbox_size(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM dm_outbox").fetchone()[0]
+
+    def complete_dm(self, dm_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM dm_outbox WHERE id = ?", (dm_id, ))
+
+    def retry_dm(self, dm_id, attempts, next_attempt_ts, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE dm_outbox SET attempts = ?, next_attempt_ts = ?, last_error = ?, "
+                "claimed_until = NULL WHERE id = ?", (attempts, next_attempt_ts, error, dm_id))
+
+    def dead_letter_dm(self, dm_id, error, block_recipient=False):
+        """Move an outbox row to the dead letters (and optionally block its recipient)"""
+        with self._lock, self._conn:
+            now_ts = time.time()
+            row = self._conn.execute(
+                "SELECT user_id, kind, content, attempts FROM dm_outbox WHERE id = ?",
+                (dm_id, )).fetchone()
+            if not row:
+                return
+            user_id, kind, content, attempts = row
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dm_dead_letters "
+                "(id, user_id, kind, content, attempts, error, failed_ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (dm_id, user_id, kind, content, attempts + 1, error, now_ts))
+            self._conn.execute("DELETE FROM dm_outbox WHERE id = ?", (dm_id, ))
+            if block_recipient:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dm_blocked_recipients (user_id, reason, blocked_ts) "
+                    "VALUES (?, ?, ?)", (user_id, error, now_ts))
+                # Nothing else queued for this user can be delivered either
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dm_dead_letters "
+                    "(id, user_id, kind, content, attempts, error, failed_ts) "
+                    "SELECT id, user_id, kind, content, attempts, ?, ? FROM dm_outbox "
+                    "WHERE user_id = ?", (error, now_ts, user_id))
+                self._conn.execute("DELETE FROM dm_outbox WHERE user_id = ?",
+                                   (user_id, ))
+
+    def blocked_recipients(self):
+        with self._lock:
+            return {
+                row[0] for row in self._conn.execute(
+                    "SELECT user_id FROM dm_blocked_recipients")
+            }
+
+
+class WriteBehindPersister:
+    """Marks auto-role state dirty and flushes coalesced changes from a worker thread"""
+
+    def __init__(self, store, interval):
+        self.store = store
+        self.interval = interval
+        self.on_dms_flushed = None  # callback once queued DMs reach the outbox
+        self._dirty_members = set()  # (guild_id, member_id) keys
+        self._deleted_members = set()
+        self._dirty_settings = set()  # guild ids
+        self._dm_messages = []
+        self._dm_cancellations = set()  # user ids whose outbox DMs get dropped
+        self._dirty = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self.flush_count = 0
+
+    def mark_member(self, key):
+        """Queue a tracked member row for writing"""
+        self._deleted_members.discard(key)
+        self._dirty_members.add(key)
+        self._dirty.set()
+
+    def mark_deleted(self, key):
+        """Queue a tracked member row for deletion"""
+        self._dirty_members.discard(key)
+        self._deleted_members.add(key)
+        self._dirty.set()
+
+    def mark_settings(self, guild_id):
+        """Queue a guild's auto-role settings for writing"""
+        self._dirty_settings.add(guild_id)
+        self._dirty.set()
+
+    def queue_dm(self, user_id, kind, content):
+        """Queue an outbox DM to be inserted with the next flush"""
+        self._dm_messages.append((user_id, kind, content))
+        self._dirty.set()
+
+    def cancel_dms(self, user_id):
+        """Drop a user's queued and not yet delivered outbox DMs with the next flush"""
+        self._dm_messages = [
+            message for message in self._dm_messages if message[0] != user_id
+        ]
+        self._dm_cancellations.add(user_id)
+        self._dirty.set()
+
+    @property
+    def pending(self):
+        return len(self._dirty_members) + len(self._deleted_members) + len(
+            self._dm_messages) + len(self._dirty_settings) + len(
+                self._dm_cancellations)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            # Let a burst of changes accumulate into a single flush
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        """Write every pending change to the store in one transaction"""
+        async with self._flush_lock:
+            self._dirty.clear()
+            if not self.pending:
+                return
+
+            dirty_members, self._dirty_members = self._dirty_members, set()
+            deleted_members, self._deleted_members = self._deleted_members, set()
+            dirty_settings, self._dirty_settings = self._dirty_settings, set()
+            dm_messages, self._dm_messages = self._dm_messages, []
+            dm_cancellations, self._dm_cancellations = self._dm_cancellations, set()
+
+            # Shallow snapshots are taken on the loop, JSON encoding happens in the thread
+            upserts = {}
+            for key in dirty_members:
+                data = get_tracked_member(key)
+                if data:
+                    upserts[key] = data  # records are replaced, never mutated
+            settings = {}
+            for guild_id in dirty_settings:
+                config = get_auto_role_config(guild_id)
+                settings[guild_id] = {
+                    setting: config[setting]
+                    for setting in AUTO_ROLE_SETTING_KEYS if setting in config
+                }
+
+            try:
+                await asyncio.to_thread(self.store.apply_batch, upserts,
+                                        deleted_members, settings, dm_messages,
+                                        dm_cancellations)
+                self.flush_count += 1
+                if dm_messages and self.on_dms_flushed:
+                    self.on_dms_flushed()
+            except Exception as e:
+                print(f"❌ Error saving auto-role state: {str(e)}")
+                # Re-queue whatever was not superseded in the meantime
+                for key in dirty_members - self._deleted_members:
+                    self._dirty_members.add(key)
+                for key in deleted_members - self._dirty_members:
+                    self._deleted_members.add(key)
+                self._dirty_settings |= dirty_settings
+                # DMs cancelled since the snapshot still have to stay cancelled
+                self._dm_messages[:0] = [
+                    message for message in dm_messages
+                    if message[0] not in self._dm_cancellations
+                ]
+                self._dm_cancellations |= dm_cancellations
+                self._dirty.set()
+
+    async def stop(self):
+        """Stop the background flusher and write out anything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+class JoinPipeline:
+    """Queues member joins and processes them through a bounded worker pool"""
+
+    def __init__(self, handler, concurrency, rate_window=60):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.rate_window = rate_window  # seconds used for the drain rate
+        self.queue = asyncio.Queue()
+        self.processed = 0
+        self.failed = 0
+        self._completions = collections.deque()  # monotonic completion times
+        self._workers = []
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def drain_rate(self):
+        """Joins processed per minute over the recent rate window"""
+        cutoff = time.monotonic() - self.rate_window
+        while self._completions and self._completions[0] < cutoff:
+            self._completions.popleft()
+        return len(self._completions) * 60 / self.rate_window
+
+    def start(self):
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def enqueue(self, member):
+        self.queue.put_nowait(member)
+
+    async def _worker(self):
+        while True:
+            member = await self.queue.get()
+            try:
+                await self.handler(member)
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Error processing join for {member.display_name}: {str(e)}")
+            finally:
+                self.processed += 1
+                self._completions.append(time.monotonic())
+                self.queue.task_done()
+
+            if self.depth and self.depth % 100 == 0:
+                print(
+                    f"📥 Join queue: {self.depth} pending, draining at {self.drain_rate():.0f}/min"
+                )
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class DMOutbox:
+    """Durable DM queue drained at a rate-limit-aware pace with retries and dead letters"""
+
+    def __init__(self, bot, store, rate, concurrency, max_attempts):
+        self.bot = bot
+        self.store = store
+        self.interval = 1 / rate if rate > 0 else 0  # seconds between sends
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.blocked = set()  # user ids that permanently refuse DMs
+        self.sent = 0
+        self.dead_lettered = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self.blocked = await asyncio.to_thread(self.store.blocked_recipients)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def queue_with_state(self, persistence, user_id, kind, content):
+        """Queue a DM to be committed together with the next state flush"""
+        if user_id in self.blocked:
+            print(f"⚠️ Skipping {kind} DM to {user_id} (DMs disabled)")
+            return False
+        persistence.queue_dm(user_id, kind, content)
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                rows = await asyncio.to_thread(self.store.claim_due_dms, time.time(),
+                                               self.concurrency * 25,
+                                               DM_OUTBOX_CLAIM_LEASE)
+            except Exception as e:
+                print(f"❌ Error reading DM outbox: {str(e)}")
+                rows = []
+
+            if not rows:
+                await self._wait_for_next_due()
+                continue
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            deliveries = []
+            for row in rows:
+                await semaphore.acquire()
+                deliveries.append(
+                    asyncio.create_task(self._deliver(row, semaphore)))
+                # Pace sends to stay well under Discord's DM rate limits
+                await asyncio.sleep(self.interval)
+            await asyncio.gather(*deliveries, return_exceptions=True)
+
+    async def _wait_for_next_due(self):
+        self._wakeup.clear()
+        try:
+            next_due = await asyncio.to_thread(self.store.next_dm_due)
+        except Exception:
+            next_due = None
+        timeout = None if next_due is None else max(0, next_due - time.time())
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _deliver(self, row, semaphore):
+        dm_id, user_id, kind, content, attempts = row
+        try:
+            if user_id in self.blocked:
+                # Blocked earlier in this batch; the store already dead-lettered the row
+                return
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(
+                user_id)
+            await user.send(content)
+            await asyncio.to_thread(self.store.complete_dm, dm_id)
+            self.sent += 1
+            print(f"✅ Sent {kind} DM to {user.display_name}")
+        except discord.Forbidden as e:
+            # DMs disabled or bot blocked: never retry this recipient
+            self.blocked.add(user_id)
+            self.dead_lettered += 1
+            await asyncio.to_thread(self.store.dead_letter_dm, dm_id, str(e),
+                                    True)
+            print(f"⚠️ Could not send {kind} DM to {user_id} (DMs disabled)")
+        except discord.NotFound as e:
+            self.dead_lettered += 1
+            await asyncio.to_thread(self.store.dead_letter_dm, dm_id, str(e))
+            print(f"⚠️ Could not send {kind} DM to {user_id} (user not found)")
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self.dead_lettered += 1
+                await asyncio.to_thread(self.store.dead_letter_dm, dm_id,
+                                        str(e))
+                print(
+                    f"❌ Giving up on {kind} DM to {user_id} after {attempts} attempts: {str(e)}"
+                )
+            else:
+                backoff = min(DM_OUTBOX_BASE_BACKOFF * 2**(attempts - 1),
+                              DM_OUTBOX_MAX_BACKOFF)
+                await asyncio.to_thread(self.store.retry_dm, dm_id, attempts,
+                                        time.time() + backoff, str(e))
+                print(
+                    f"❌ Error sending {kind} DM to {user_id}, retrying in {backoff}s: {str(e)}"
+                )
+        finally:
+            semaphore.release()
+
+
+class RateLimiter:
+    """Token bucket that paces REST calls to a steady rate with a small burst"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChannelBroadcaster:
+    """Sends one message to many channels concurrently, paced per channel"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._limiters = {}  # channel id: RateLimiter
+        self._edits = {}  # (channel id, message id): (latest render, waiting futures)
+        self._edit_tasks = set()  # running edit loops, referenced until they finish
+
+    def _limiter(self, channel_id):
+        limiter = self._limiters.get(channel_id)
+        if limiter is None:
+            limiter = self._limiters[channel_id] = RateLimiter(
+                self.rate, self.burst)
+        return limiter
+
+    async def broadcast(self, channels, content):
+        """Send content to every channel, returning (channel, message, error, latency_ms) each
+
+        message is None and error set when a send failed; latency is measured
+        from the start of the broadcast so slow channels show up in the report.
+        """
+        started = time.monotonic()
+
+        async def send(channel):
+            await self._limiter(channel.id).acquire()
+            message = error = None
+            try:
+                message = await channel.send(content)
+            except discord.Forbidden:
+                error = "no permission"
+            except discord.HTTPException as e:
+                error = str(e)
+            except Exception as e:
+                # One broken channel must not lose the messages sent to the others
+                error = str(e) or type(e).__name__
+            return channel, message, error, (time.monotonic() - started) * 1000
+
+        return await asyncio.gather(*(send(channel) for channel in channels))
+
+    async def edit(self, channel, message_id, render):
+        """Edit a sent message and return None or an error
+
+        render is an async callable returning the content; it runs right
+        before the edit is sent, so edits queued for the same message while
+        it waits for its channel's budget (or for the previous edit) are
+        coalesced into one that shows the newest state.
+        """
+        key = (channel.id, message_id)
+        waiter = asyncio.get_running_loop().create_future()
+        pending = self._edits.get(key)
+        if pending is None:
+            self._edits[key] = [render, [waiter]]
+            task = asyncio.create_task(self._run_edits(channel, key))
+            self._edit_tasks.add(task)
+            task.add_done_callback(self._edit_tasks.discard)
+        else:
+            pending[0] = render
+            pending[1].append(waiter)
+        return await waiter
+
+    async def _run_edits(self, channel, key):
+        try:
+            while True:
+                await self._limiter(channel.id).acquire()
+                render, waiters = self._edits[key]
+                self._edits[key] = [render, []]  # Later edits wait for the next round
+                error = None
+                try:
+                    content = await render()
+                    await channel.get_partial_message(key[1]).edit(content=content)
+                except discord.NotFound:
+                    error = "message was deleted"
+                except discord.Forbidden:
+                    error = "no permission"
+                except discord.HTTPException as e:
+                    error = str(e)
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(error)
+                if not self._edits[key][1]:
+                    return
+        finally:
+            waiters = self._edits.pop(key, [None, []])[1]
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result("edit was cancelled")
+
+    async def edit_messages(self, targets, render):
+        """Edit (channel, message_id) targets concurrently: (channel, error, latency_ms) each"""
+        started = time.monotonic()
+
+        async def edit(channel, message_id):
+            error = await self.edit(channel, message_id, render)
+            return channel, error, (time.monotonic() - started) * 1000
+
+        return await asyncio.gather(*(edit(*target) for target in targets))
+
+    async def reply_to_messages(self, targets, content):
+        """Reply to (channel, message_id) targets concurrently: (channel, error, latency_ms) each"""
+        started = time.monotonic()
+
+        async def reply(channel, message_id):
+            await self._limiter(channel.id).acquire()
+            error = None
+            try:
+                await channel.send(content, reference=discord.MessageReference(
+                    message_id=message_id, channel_id=channel.id,
+                    fail_if_not_exists=False))
+            except discord.Forbidden:
+                error = "no permission"
+            except discord.HTTPException as e:
+                error = str(e)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            return channel, error, (time.monotonic() - started) * 1000
+
+        return await asyncio.gather(*(reply(*target) for target in targets))
+
+
+class GuildResolverIndex:
+    """Per-guild lookup of channels and roles by lowercase name, mention or ID
+
+    Name maps are built lazily and dropped by the bot's channel, role and guild
+    events; the bot's send permission per channel is cached the same way.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._channels = {}  # guild_id: {lowercase name: text channel}
+        self._roles = {}  # guild_id: {lowercase name: role}
+        self._can_send = {}  # guild_id: {channel_id: bool}
+
+    @staticmethod
+    def _parse_id(identifier, prefix):
+        if identifier.startswith(prefix) and identifier.endswith('>'):
+            identifier = identifier[len(prefix):-1]
+        return int(identifier) if identifier.isdigit() else None
+
+    def channel(self, guild, identifier):
+        """Text channel for a mention, ID or name, or None"""
+        channel_id = self._parse_id(identifier, '<#')
+        if channel_id is not None:
+            channel = self.client.get_channel(channel_id)
+        elif guild:
+            names = self._channels.get(guild.id)
+            if names is None:
+                names = self._channels[guild.id] = {}
+                for text_channel in guild.text_channels:
+                    names.setdefault(text_channel.name.lower(), text_channel)
+            channel = names.get(identifier.lower())
+        else:
+            channel = None
+        return channel if isinstance(channel, discord.TextChannel) else None
+
+    def role(self, guild, identifier):
+        """Role for a mention, ID or name, or None"""
+        if not guild:
+            return None
+        role_id = self._parse_id(identifier, '<@&')
+        if role_id is not None:
+            return guild.get_role(role_id)
+        names = self._roles.get(guild.id)
+        if names is None:
+            names = self._roles[guild.id] = {}
+            for role in guild.roles:
+                names.setdefault(role.name.lower(), role)
+        return names.get(identifier.lower())
+
+    def can_send(self, channel):
+        """Whether the bot may post in channel, computed once per permission change"""
+        cache = self._can_send.setdefault(channel.guild.id, {})
+        allowed = cache.get(channel.id)
+        if allowed is None:
+            permissions = channel.permissions_for(channel.guild.me)
+            allowed = cache[channel.id] = (permissions.view_channel
+                                           and permissions.send_messages)
+        return allowed
+
+    def invalidate_channels(self, guild_id, channel_id=None):
+        self._channels.pop(guild_id, None)
+        self.invalidate_permissions(guild_id, channel_id)
+
+    def invalidate_roles(self, guild_id):
+        # Role changes can change the bot's permissions everywhere in the guild
+        self._roles.pop(guild_id, None)
+        self.invalidate_permissions(guild_id)
+
+    def invalidate_permissions(self, guild_id, channel_id=None):
+        if channel_id is None:
+            self._can_send.pop(guild_id, None)
+        else:
+            self._can_send.get(guild_id, {}).pop(channel_id, None)
+
+    def forget_guild(self, guild_id):
+        self._channels.pop(guild_id, None)
+        self._roles.pop(guild_id, None)
+        self._can_send.pop(guild_id, None)
+
+
+class ExpiryExecutor:
+    """Removes expired roles at the REST budget so a large cohort drains over a bounded window
+
+    Due members are processed in batches with bounded concurrency; each batch
+    collects per-member outcomes and commits its state changes in one write.
+    """
+
+    def __init__(self, handler, limiter, concurrency, commit):
+        self.handler = handler  # async ((guild_id, member_id)) -> outcome string
+        self.limiter = limiter
+        self.concurrency = max(1, concurrency)
+        self.commit = commit  # async () -> None, persists a finished batch
+        self.processed = 0
+        self.in_flight = 0
+        self._queue = collections.deque()
+        self._queued = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def backlog(self):
+        return len(self._queue) + self.in_flight
+
+    def planned_drain_time(self):
+        """When the current backlog is expected to be fully processed"""
+        return datetime.now(AMSTERDAM_TZ) + timedelta(
+            seconds=self.backlog / self.limiter.rate)
+
+    def submit(self, keys):
+        """Queue due members; expiry instants are untouched, only the removal is paced"""
+        for key in keys:
+            if key not in self._queued:
+                self._queued.add(key)
+                self._queue.append(key)
+        self._wakeup.set()
+
+        if self.backlog > self.limiter.burst:
+            print(
+                f"⏳ {self.backlog} expired role(s) queued, planned drain by {self.planned_drain_time().strftime('%H:%M:%S')}"
+            )
+
+    def discard(self, key):
+        """Forget a queued member (the worker skips it)"""
+        self._queued.discard(key)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def process_batch(self, keys):
+        """Expire members concurrently and return {(guild_id, member_id): outcome}"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes = {}
+
+        async def expire(key):
+            async with semaphore:
+                try:
+                    if key not in self._queued:
+                        outcomes[key] = "skipped"  # Discarded while waiting
+                        return
+                    await self.limiter.acquire()
+                    # Check and claim with no await in between, it may have been
+                    # discarded while waiting for the budget
+                    if key not in self._queued:
+                        outcomes[key] = "skipped"
+                        return
+                    self._queued.discard(key)
+                    outcomes[key] = await self.handler(key)
+                except Exception as e:
+                    print(f"❌ Error expiring member {key}: {str(e)}")
+                    outcomes[key] = "error"
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+
+        self.in_flight += len(keys)
+        await asyncio.gather(*(expire(key) for key in keys))
+        return outcomes
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # A key discarded and resubmitted while queued appears twice
+            batch = list(dict.fromkeys(self._queue))
+            self._queue.clear()
+            outcomes = await self.process_batch(batch)
+
+            # One state write for the whole batch
+            await self.commit()
+
+            if len(outcomes) > 1:
+                summary = collections.Counter(outcomes.values())
+                print(f"✅ Expiry batch of {len(outcomes)} member(s): " +
+                      ", ".join(f"{count} {outcome}"
+                                for outcome, count in summary.items()))
+
+
+def signal_day(created_ts):
+    """Amsterdam calendar day (ISO date) a signal's stats are bucketed under"""
+    return datetime.fromtimestamp(created_ts, AMSTERDAM_TZ).date().isoformat()
+
+
+class SignalLedger:
+    """SQLite (WAL) record of sent signals, their levels and message IDs per channel
+
+    Every method is blocking; writes come from SignalRecorder's worker thread
+    and queries should be called through asyncio.to_thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        with self._lock:
+            if self._conn is not None:
+                return
+
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            with conn:
+                conn.execute("""CREATE TABLE IF NOT EXISTS signals (
+                        id INTEGER PRIMARY KEY,
+                        created_ts REAL NOT NULL,
+                        guild_id INTEGER,
+                        author_id INTEGER,
+                        pair TEXT NOT NULL,
+                        entry_type TEXT NOT NULL,
+                        is_buy INTEGER NOT NULL,
+                        entry REAL NOT NULL,
+                        sl REAL NOT NULL,
+                        tps TEXT NOT NULL,
+                        best_tp INTEGER NOT NULL DEFAULT 0,
+                        sl_hit INTEGER NOT NULL DEFAULT 0,
+                        closed INTEGER NOT NULL DEFAULT 0,
+                        content TEXT,
+                        updates TEXT NOT NULL DEFAULT '[]')""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS idx_signals_created
+                        ON signals (created_ts)""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS idx_signals_pair_created
+                        ON signals (pair, created_ts)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS signal_messages (
+                        signal_id INTEGER NOT NULL,
+                        channel_id INTEGER NOT NULL,
+                        message_id INTEGER NOT NULL,
+                        PRIMARY KEY (signal_id, channel_id))""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS idx_signal_messages_message
+                        ON signal_messages (message_id)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS history_cursors (
+                        channel_id INTEGER PRIMARY KEY,
+                        last_message_id INTEGER NOT NULL)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS history_messages (
+                        message_id INTEGER PRIMARY KEY,
+                        channel_id INTEGER NOT NULL,
+                        created_ts REAL NOT NULL,
+                        kind TEXT NOT NULL,
+                        pair TEXT,
+                        signal_id INTEGER,
+                        data TEXT NOT NULL)""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS idx_history_messages_kind_created
+                        ON history_messages (kind, created_ts)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS signal_outcomes (
+                        signal_id INTEGER NOT NULL,
+                        outcome TEXT NOT NULL,
+                        hit_ts REAL NOT NULL,
+                        price REAL,
+                        PRIMARY KEY (signal_id, outcome))""")
+
+                # Per-day, per-pair aggregates maintained with every write
+                conn.execute("""CREATE TABLE IF NOT EXISTS stat_buckets (
+                        day TEXT NOT NULL,
+                        pair TEXT NOT NULL,
+                        metric TEXT NOT NULL,
+                        value REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (day, pair, metric))""")
+            self._conn = conn
+
+    _BUMP_SQL = ("INSERT INTO stat_buckets (day, pair, metric, value) VALUES (?, ?, ?, ?) "
+                 "ON CONFLICT (day, pair, metric) DO UPDATE SET value = value + excluded.value")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record_batch(self, signals, outcomes=()):
+        """Insert signal dicts (with their 'messages' {channel_id: message_id}) and
+        apply (signal_id, outcome, hit_ts, price) tuples, all in one transaction
+
+        Returns the ids SQLite assigned to the signals, in order.
+        """
+        with self._lock, self._conn:
+            signal_ids = []
+            for signal in signals:
+                cursor = self._conn.execute(
+                    "INSERT INTO signals (created_ts, guild_id, author_id, pair, "
+                    "entry_type, is_buy, entry, sl, tps, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (signal['created_ts'], signal['guild_id'], signal['author_id'],
+                     signal['pair'], signal['entry_type'], int(signal['is_buy']),
+                     signal['entry'], signal['sl'], json.dumps(signal['tps']),
+                     signal.get('content')))
+                signal_ids.append(cursor.lastrowid)
+            self._conn.executemany(
+                "INSERT INTO signal_messages (signal_id, channel_id, message_id) "
+                "VALUES (?, ?, ?)",
+                [(signal_id, channel_id, message_id)
+                 for signal_id, signal in zip(signal_ids, signals)
+                 for channel_id, message_id in signal['messages'].items()])
+            self._conn.executemany(self._BUMP_SQL, [
+                (signal_day(signal['created_ts']), signal['pair'], "signals", 1)
+                for signal in signals
+            ])
+            for signal_id, outcome, hit_ts, price in outcomes:
+                self._apply_outcome(signal_id, outcome, hit_ts, price)
+        return signal_ids
+
+    def _apply_outcome(self, signal_id, outcome, hit_ts, price=None):
+        """Record a 'tpN', 'sl' or 'breakeven' hit and bump the signal's day bucket
+
+        TP hits only move forward (TP3 also counts TP1 and TP2). Before TP1 an
+        SL closes the signal as a loss; once a TP was hit, a return to the entry
+        or the SL closes it at breakeven and later TPs no longer count. Pips
+        gained are the distance to the best TP reached, or minus the SL
+        distance for losses.
+        """
+        row = self._conn.execute(
+            "SELECT created_ts, pair, entry, sl, tps, best_tp, closed FROM signals WHERE id = ?",
+            (signal_id, )).fetchone()
+        if row is None or row['closed']:
+            return False
+
+        day, pair = signal_day(row['created_ts']), row['pair']
+        pip_value = PAIR_CONFIG.get(pair, {}).get('pip_value') or 1
+        tps = json.loads(row['tps'])
+        best_tp = row['best_tp']
+
+        if outcome in ("sl", "breakeven"):
+            if best_tp:
+                self._conn.execute("UPDATE signals SET closed = 1 WHERE id = ?",
+                                   (signal_id, ))
+                bumps = [("breakeven", 1)]
+                hits = ["breakeven"]
+            elif outcome == "sl":
+                self._conn.execute(
+                    "UPDATE signals SET sl_hit = 1, closed = 1 WHERE id = ?",
+                    (signal_id, ))
+                bumps = [("sl", 1), ("pips", -abs(row['entry'] - row['sl']) / pip_value)]
+                hits = ["sl"]
+            else:
+                return False  # Back at the entry before TP1 changes nothing
+        else:
+            level = int(outcome[2:])
+            if not best_tp < level <= len(tps):
+                return False
+            self._conn.execute(
+                "UPDATE signals SET best_tp = ?, closed = ? WHERE id = ?",
+                (level, int(level == len(tps)), signal_id))
+            previous = tps[best_tp - 1] if best_tp else row['entry']
+            hits = [f"tp{number}" for number in range(best_tp + 1, level + 1)]
+            bumps = [(hit, 1) for hit in hits]
+            bumps.append(("pips", abs(tps[level - 1] - previous) / pip_value))
+
+        self._conn.executemany(self._BUMP_SQL, [(day, pair, metric, amount)
+                                                for metric, amount in bumps])
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO signal_outcomes (signal_id, outcome, hit_ts, price) "
+            "VALUES (?, ?, ?, ?)", [(signal_id, hit, hit_ts, price) for hit in hits])
+        return True
+
+    def open_signals(self, after_id=0):
+        """Signals newer than after_id that still have a TP or their stop left to hit"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM signals WHERE closed = 0 AND id > ? ORDER BY id",
+                (after_id, )).fetchall()
+        return [self._signal_dict(row) for row in rows]
+
+    def signal_outcomes(self, signal_id):
+        """{outcome: (hit_ts, price)} recorded for a signal"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT outcome, hit_ts, price FROM signal_outcomes WHERE signal_id = ?",
+                (signal_id, )).fetchall()
+        return {outcome: (hit_ts, price) for outcome, hit_ts, price in rows}
+
+    def aggregate(self, start_day, end_day, pair=None):
+        """Sum the day buckets in [start_day, end_day] (dates), optionally for one pair
+
+        Returns signals, closed (TP1 or SL hit), open, tp_hits (TP1 first), sl,
+        breakeven (closed at entry after a TP) and pips.
+        """
+        query = "SELECT metric, SUM(value) FROM stat_buckets WHERE day >= ? AND day <= ?"
+        params = [start_day.isoformat(), end_day.isoformat()]
+        if pair:
+            query += " AND pair = ?"
+            params.append(pair.upper())
+        with self._lock:
+            totals = dict(self._conn.execute(query + " GROUP BY metric", params))
+
+        tp_hits = []
+        while f"tp{len(tp_hits) + 1}" in totals:
+            tp_hits.append(int(totals[f"tp{len(tp_hits) + 1}"]))
+        signals = int(totals.get("signals", 0))
+        sl = int(totals.get("sl", 0))
+        closed = (tp_hits[0] if tp_hits else 0) + sl
+        return {
+            'signals': signals,
+            'closed': closed,
+            'open': signals - closed,
+            'tp_hits': tp_hits,
+            'sl': sl,
+            'breakeven': int(totals.get("breakeven", 0)),
+            'pips': totals.get("pips", 0.0)
+        }
+
+    @staticmethod
+    def _signal_dict(row):
+        signal = dict(row)
+        signal['is_buy'] = bool(signal['is_buy'])
+        signal['tps'] = json.loads(signal['tps'])
+        signal['updates'] = json.loads(signal['updates'])
+        return signal
+
+    def signals_between(self, start_ts, end_ts, pair=None):
+        """Signals created in [start_ts, end_ts), optionally for one pair, oldest first"""
+        query = "SELECT * FROM signals WHERE created_ts >= ? AND created_ts < ?"
+        params = [start_ts, end_ts]
+        if pair:
+            query += " AND pair = ?"
+            params.append(pair.upper())
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_ts",
+                                      params).fetchall()
+        return [self._signal_dict(row) for row in rows]
+
+    def signal(self, signal_id):
+        """One signal with its 'messages' {channel_id: message_id}, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM signals WHERE id = ?",
+                                     (signal_id, )).fetchone()
+            messages = self._conn.execute(
+                "SELECT channel_id, message_id FROM signal_messages WHERE signal_id = ?",
+                (signal_id, )).fetchall()
+        if row is None:
+            return None
+        signal = self._signal_dict(row)
+        signal['messages'] = {channel_id: message_id
+                              for channel_id, message_id in messages}
+        return signal
+
+    def signal_id_for_message(self, message_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT signal_id FROM signal_messages WHERE message_id = ?",
+                (message_id, )).fetchone()
+        return row[0] if row else None
+
+    def recent_signals(self, guild_id=None, limit=25):
+        """Newest signals first, optionally for one guild"""
+        query = "SELECT id, created_ts, pair, entry_type, entry FROM signals"
+        params = []
+        if guild_id:
+            query += " WHERE guild_id = ?"
+            params.append(guild_id)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id DESC LIMIT ?",
+                                      params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_signal_update(self, signal_id, line):
+        """Append a line to a signal's update log; returns (sent content, all updates)"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT content, updates FROM signals WHERE id = ?",
+                (signal_id, )).fetchone()
+            if row is None:
+                return None, []
+            updates = json.loads(row['updates']) + [line]
+            self._conn.execute("UPDATE signals SET updates = ? WHERE id = ?",
+                               (json.dumps(updates), signal_id))
+        return row['content'], updates
+
+    def signal_text(self, signal_id):
+        """A signal's sent content and update log as (content, updates)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, updates FROM signals WHERE id = ?",
+                (signal_id, )).fetchone()
+        if row is None:
+            return None, []
+        return row['content'], json.loads(row['updates'])
+
+    def history_cursor(self, channel_id):
+        """Last message ID indexed in a channel, or None before its first run"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_message_id FROM history_cursors WHERE channel_id = ?",
+                (channel_id, )).fetchone()
+        return row[0] if row else None
+
+    def record_history(self, channel_id, messages, last_message_id):
+        """Store parsed channel messages and advance the channel's cursor together
+
+        messages are (message_id, created_ts, kind, pair, data) tuples; signals
+        are linked to the ledger signal that sent them when there is one.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO history_messages "
+                "(message_id, channel_id, created_ts, kind, pair, signal_id, data) "
+                "VALUES (?, ?, ?, ?, ?, (SELECT signal_id FROM signal_messages "
+                "WHERE message_id = ?), ?)",
+                [(message_id, channel_id, created_ts, kind, pair, message_id,
+                  json.dumps(data))
+                 for message_id, created_ts, kind, pair, data in messages])
+            self._conn.execute(
+                "INSERT INTO history_cursors (channel_id, last_message_id) VALUES (?, ?) "
+                "ON CONFLICT (channel_id) DO UPDATE SET last_message_id = excluded.last_message_id",
+                (channel_id, last_message_id))
+
+    def history_messages(self, kind=None, start_ts=0, end_ts=float("inf"),
+                         channel_id=None):
+        """Indexed channel messages created in [start_ts, end_ts), oldest first"""
+        query = "SELECT * FROM history_messages WHERE created_ts >= ? AND created_ts < ?"
+        params = [start_ts, end_ts]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if channel_id:
+            query += " AND channel_id = ?"
+            params.append(channel_id)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_ts",
+                                      params).fetchall()
+        return [dict(row, data=json.loads(row['data'])) for row in rows]
+
+
+class SignalRecorder:
+    """Queues ledger writes off the signal path and commits them in batches"""
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self._pending = []
+        self._pending_outcomes = []  # (signal_id, 'tpN' or 'sl', hit_ts, price)
+        self._dirty = asyncio.Event()
+        self._flush_lock = asyncio.Lock()  # keeps batches in queue order
+        self._task = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, guild_id, author_id, pair, entry_type, levels, messages,
+               content=None):
+        """Queue a sent signal; returns False if the ledger is not running
+
+        levels are LevelEngine.levels() values, messages maps channel_id to
+        the sent message_id and content is the sent text. The id is assigned
+        by SQLite when the batch is written.
+        """
+        if self._task is None:
+            return False  # Ledger could not be opened
+        is_buy, swing = parse_entry_type(entry_type)
+        self._pending.append({
+            'created_ts': time.time(),
+            'guild_id': guild_id,
+            'author_id': author_id,
+            'pair': pair.upper(),
+            'entry_type': entry_type,
+            'is_buy': is_buy,
+            'entry': levels['entry'],
+            'sl': levels['sl'],
+            'tps': levels['tps'],
+            'messages': dict(messages),
+            'content': content
+        })
+        self._dirty.set()
+        return True
+
+    def record_outcome(self, signal_id, outcome, hit_ts=None, price=None):
+        """Queue a 'tpN' or 'sl' hit; it is written after the signal itself"""
+        self._pending_outcomes.append(
+            (signal_id, outcome, time.time() if hit_ts is None else hit_ts,
+             price))
+        self._dirty.set()
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            if not await self.flush():
+                await asyncio.sleep(5)  # Back off before retrying the batch
+
+    async def flush(self):
+        """Write every queued signal and outcome in one transaction; False if it failed"""
+        async with self._flush_lock:
+            self._dirty.clear()
+            if not self._pending and not self._pending_outcomes:
+                return True
+            signals, self._pending = self._pending, []
+            outcomes, self._pending_outcomes = self._pending_outcomes, []
+            try:
+                await asyncio.to_thread(self.ledger.record_batch, signals,
+                                        outcomes)
+            except Exception as e:
+                print(f"❌ Error writing signal ledger: {str(e)}")
+                self._pending[:0] = signals
+                self._pending_outcomes[:0] = outcomes
+                self._dirty.set()
+                return False
+            return True
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+SIGNAL_MESSAGE_PREFIX = "**Trade Signal For:"
+STATS_MESSAGE_PREFIX = "**:bar_chart: TRADING SIGNAL STATISTICS**"
+
+
+def _message_number(text):
+    return float(text.replace("$", "").replace(",", ""))
+
+
+def parse_signal_message(content):
+    """Pair, entry type and levels of a /entry signal message, or None"""
+    pair = re.search(r"Trade Signal For: ([^*\n]+)\*\*", content)
+    entry_type = re.search(r"Entry Type: (.+)", content)
+    entry = re.search(r"Entry Price: (\$?[\d.,]+)", content)
+    sl = re.search(r"Stop Loss: (\$?[\d.,]+)", content)
+    tps = re.findall(r"TP\d+: (\$?[\d.,]+)", content)
+    if not (pair and entry_type and entry and sl):
+        return None
+    return {
+        'pair': pair.group(1).strip().upper(),
+        'entry_type': entry_type.group(1).strip(),
+        'entry': _message_number(entry.group(1)),
+        'tps': [_message_number(tp) for tp in tps],
+        'sl': _message_number(sl.group(1))
+    }
+
+
+def parse_stats_message(content):
+    """Period and counts of a /stats message, or None"""
+    period = re.search(r"Period:\*\* (.+)", content)
+    if not period:
+        return None
+
+    def count(label):
+        match = re.search(label + r": \*\*([^*]+)\*\*", content)
+        return match.group(1).strip() if match else None
+
+    stats = {
+        'period': period.group(1).strip(),
+        'total_signals': count("Total Signals Sent"),
+        'closed': count("Total Closed Positions"),
+        'open': count("Currently Open"),
+        'tp_hits': [int(hits) for hits in re.findall(r"TP\d+ Hits: \*\*(\d+)\*\*", content)],
+        'sl': count("SL Hits"),
+        'pips': count("Pips Gained")
+    }
+    for key in ('total_signals', 'closed', 'sl'):
+        if stats[key] is not None and stats[key].isdigit():
+            stats[key] = int(stats[key])
+    if stats['pips'] is not None:
+        stats['pips'] = float(stats['pips'])
+    return stats
+
+
+class ChannelHistoryIndexer:
+    """Tails signal channels and indexes the bot's own signal and stats messages
+
+    Each channel keeps a cursor (the last message ID seen) in the ledger, so a
+    run fetches only newer messages, 100 per request, and resumes after a
+    restart. The first run backfills HISTORY_INDEX_BACKFILL_DAYS.
+    """
+
+    PAGE_SIZE = 100  # Messages per history request
+
+    def __init__(self, client, ledger, channel_ids, backfill_days):
+        self.client = client
+        self.ledger = ledger
+        self.channel_ids = channel_ids
+        self.backfill_days = backfill_days
+        self._lock = asyncio.Lock()
+
+    async def run(self):
+        """Index every configured channel once; returns the number of messages indexed"""
+        indexed = 0
+        async with self._lock:
+            for channel_id in self.channel_ids:
+                # Channels of guilds on other processes' shards are not cached here
+                channel = self.client.get_channel(channel_id)
+                if channel is None:
+                    try:
+                        channel = await self.client.fetch_channel(channel_id)
+                    except (discord.NotFound, discord.Forbidden):
+                        print(f"⚠️ History indexer: channel {channel_id} not found")
+                        continue
+                    except discord.HTTPException as e:
+                        print(f"❌ History indexer could not fetch channel {channel_id}: {str(e)}")
+                        continue
+                try:
+                    indexed += await self.index_channel(channel)
+                except discord.Forbidden:
+                    print(f"⚠️ History indexer: no permission to read #{channel.name}")
+                except Exception as e:
+                    print(f"❌ History indexer failed on #{channel.name}: {str(e)}")
+        return indexed
+
+    async def index_channel(self, channel):
+        cursor = await asyncio.to_thread(self.ledger.history_cursor, channel.id)
+        if cursor is None:
+            after = discord.Object(id=discord.utils.time_snowflake(
+                discord.utils.utcnow() - timedelta(days=self.backfill_days)))
+        else:
+            after = discord.Object(id=cursor)
+
+        # Parsed messages and the cursor are saved once per page of history
+        indexed = seen = 0
+        batch = []
+        last_message_id = None
+        async for message in channel.history(limit=None, after=after,
+                                              oldest_first=True):
+            last_message_id = message.id
+            seen += 1
+            parsed = self.parse(message)
+            if parsed:
+                batch.append(parsed)
+            if seen % self.PAGE_SIZE == 0:
+                await asyncio.to_thread(self.ledger.record_history, channel.id,
+                                        batch, last_message_id)
+                indexed += len(batch)
+                batch = []
+        if seen % self.PAGE_SIZE:
+            await asyncio.to_thread(self.ledger.record_history, channel.id,
+                                    batch, last_message_id)
+            indexed += len(batch)
+        if indexed:
+            print(f"📥 Indexed {indexed} message(s) from #{channel.name}")
+        return indexed
+
+    def parse(self, message):
+        """(message_id, created_ts, kind, pair, data) for the bot's own messages, or None"""
+        if self.client.user is None or message.author.id != self.client.user.id:
+            return None
+        content = message.content
+        if content.startswith(SIGNAL_MESSAGE_PREFIX):
+            data = parse_signal_message(content)
+            kind = "signal"
+        elif content.startswith(STATS_MESSAGE_PREFIX):
+            data = parse_stats_message(content)
+            kind = "stats"
+        else:
+            return None
+        if data is None:
+            return None
+        return (message.id, message.created_at.timestamp(), kind,
+                data.get('pair'), data)
+
+
+def parse_tick(record):
+    """(pair, price, ts) from a tick dict with pair/symbol, price/bid and optional ts"""
+    pair = record.get('pair') or record.get('symbol')
+    price = record.get('price', record.get('bid'))
+    ts = record.get('ts') or record.get('timestamp')
+    return str(pair).upper(), float(price), float(ts) if ts else time.time()
+
+
+class FileTickFeed:
+    """Replays ticks from a local CSV (pair,price[,ts] with header) or NDJSON file"""
+
+    def __init__(self, path, file_format, chunk_size=5000):
+        self.path = path
+        self.file_format = file_format  # "csv" or "ndjson"
+        self.chunk_size = chunk_size
+
+    def _read_chunks(self):
+        with open(self.path, newline='') as ticks_file:
+            if self.file_format == "csv":
+                records = csv.DictReader(ticks_file)
+            else:
+                records = (json.loads(line) for line in ticks_file
+                           if line.strip())
+            chunk = []
+            for record in records:
+                chunk.append(parse_tick(record))
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    async def ticks(self):
+        # File reads and parsing happen in a thread, a chunk at a time
+        chunks = self._read_chunks()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            for tick in chunk:
+                yield tick
+
+
+class SocketTickFeed:
+    """Listens on a local TCP port for NDJSON ticks pushed by a price bridge"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._queue = asyncio.Queue(maxsize=10000)
+
+    async def _handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    try:
+                        await self._queue.put(parse_tick(json.loads(line)))
+                    except (ValueError, TypeError) as e:
+                        print(f"⚠️ Ignoring malformed tick: {str(e)}")
+        finally:
+            writer.close()
+
+    async def ticks(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"✅ Price feed listening on {self.host}:{self.port}")
+        async with server:
+            while True:
+                yield await self._queue.get()
+
+
+def make_price_feed(spec):
+    """Build a price feed from a PRICE_FEED spec, or None when unset"""
+    if not spec:
+        return None
+    kind, _, target = spec.partition(":")
+    if kind in ("csv", "ndjson"):
+        return FileTickFeed(target, kind)
+    if kind == "socket":
+        host, _, port = target.rpartition(":")
+        return SocketTickFeed(host or "127.0.0.1", int(port))
+    raise ValueError(f"Unknown PRICE_FEED '{spec}'")
+
+
+class OutcomeTracker:
+    """Marks TP/SL hits of open signals from a price feed
+
+    Each pair keeps two sorted threshold lists: levels hit when price rises to
+    them (buy TPs, sell stops) and levels hit when price falls to them (buy
+    stops, sell TPs). A tick bisects both lists and only touches crossed
+    thresholds. After TP1 a signal's stop moves from the SL to its entry, and
+    a closed signal's thresholds are removed. New signals are picked up by
+    polling the ledger, so signals sent from any process are tracked.
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.ledger = None
+        self._last_id = 0  # newest signal id loaded from the ledger
+        self._rising = collections.defaultdict(list)  # pair: [(level, signal_id, outcome)]
+        self._falling = collections.defaultdict(list)
+        self._open = {}  # signal_id: state dict of a tracked signal
+        self.ticks = 0
+        self.hits = 0
+        self._task = None
+        self._poll_task = None
+
+    def __len__(self):
+        return len(self._open)
+
+    def add_signal(self, record):
+        """Index a ledger signal dict's remaining thresholds"""
+        best_tp = record.get('best_tp', 0)
+        signal_id, pair = record['id'], record['pair']
+        tp_side, stop_side = ((self._rising, self._falling) if record['is_buy']
+                              else (self._falling, self._rising))
+        state = self._open[signal_id] = {
+            'entry': record['entry'],
+            'best_tp': best_tp,
+            'tp_count': len(record['tps']),
+            'stop_side': stop_side[pair],
+            'thresholds': []  # (side list, threshold) still indexed
+        }
+        for number, level in enumerate(record['tps'], start=1):
+            if number > best_tp:
+                self._index(state, tp_side[pair], (level, signal_id, f"tp{number}"))
+        if best_tp:
+            self._index(state, state['stop_side'],
+                        (record['entry'], signal_id, "breakeven"))
+        else:
+            self._index(state, state['stop_side'], (record['sl'], signal_id, "sl"))
+
+    @staticmethod
+    def _index(state, side, threshold):
+        bisect.insort(side, threshold)
+        state['thresholds'].append((side, threshold))
+
+    @staticmethod
+    def _unindex(side, threshold):
+        position = bisect.bisect_left(side, threshold)
+        if position < len(side) and side[position] == threshold:
+            del side[position]
+
+    def _close(self, signal_id):
+        """Stop tracking a signal and drop its remaining thresholds"""
+        state = self._open.pop(signal_id)
+        for side, threshold in state['thresholds']:
+            self._unindex(side, threshold)
+
+    def process_tick(self, pair, price, ts):
+        """Record every threshold this tick crosses, returning (signal_id, outcome) hits"""
+        self.ticks += 1
+        rising, falling = self._rising.get(pair), self._falling.get(pair)
+        crossed = []
+        if rising and rising[0][0] <= price:
+            end = bisect.bisect_right(rising, (price, float('inf')))
+            crossed += rising[:end]
+            del rising[:end]
+        if falling and falling[-1][0] >= price:
+            start = bisect.bisect_left(falling, (price, ))
+            crossed += reversed(falling[start:])
+            del falling[start:]
+
+        hits = []
+        for level, signal_id, outcome in crossed:
+            state = self._open.get(signal_id)
+            if state is None:
+                continue  # Closed by an earlier threshold of this tick
+            if outcome in ("sl", "breakeven"):
+                self._close(signal_id)
+            else:
+                number = int(outcome[2:])
+                if number <= state['best_tp']:
+                    continue
+                first_tp = not state['best_tp']
+                state['best_tp'] = number
+                if number == state['tp_count']:
+                    self._close(signal_id)  # Every TP hit
+                elif first_tp:
+                    # The stop moves to the entry once TP1 is in
+                    for side, threshold in state['thresholds']:
+                        if threshold[2] == "sl":
+                            self._unindex(side, threshold)
+                    self._index(state, state['stop_side'],
+                                (state['entry'], signal_id, "breakeven"))
+            self.recorder.record_outcome(signal_id, outcome, ts, price)
+            hits.append((signal_id, outcome))
+        self.hits += len(hits)
+        return hits
+
+    async def start(self, feed, ledger):
+        """Load the open signals from the ledger and follow the feed"""
+        if self._task is None or self._task.done():
+            self.ledger = ledger
+            await self._load_new_signals()
+            self._task = asyncio.create_task(self._run(feed))
+            self._poll_task = asyncio.create_task(self._poll())
+            print(f"✅ Outcome tracker following {len(self)} open signal(s)")
+
+    async def _load_new_signals(self):
+        for record in await asyncio.to_thread(self.ledger.open_signals,
+                                              self._last_id):
+            self.add_signal(record)
+            self._last_id = max(self._last_id, record['id'])
+
+    async def _poll(self):
+        """Index signals recorded since the last poll, by this or any other process"""
+        while True:
+            await asyncio.sleep(OUTCOME_POLL_INTERVAL)
+            try:
+                await self._load_new_signals()
+            except Exception as e:
+                print(f"❌ Error polling the signal ledger: {str(e)}")
+
+    async def _run(self, feed):
+        try:
+            async for pair, price, ts in feed.ticks():
+                for signal_id, outcome in self.process_tick(pair, price, ts):
+                    print(f"🎯 Signal #{signal_id} {pair} hit {outcome.upper()} at {price}")
+        except Exception as e:
+            print(f"❌ Price feed stopped: {str(e)}")
+
+    async def stop(self):
+        for task in (self._task, self._poll_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._poll_task = None
+
+
+class TradingBot(commands.AutoShardedBot):
+
+    def __init__(self):
+        super().__init__(command_prefix='!',
+                         intents=intents,
+                         shard_count=SHARD_COUNT,
+                         shard_ids=SHARD_IDS)
+        self.expiry_scheduler = ExpiryScheduler()
+        self.expiry_index = ExpiryIndex()  # sorted view for /timedautorole list
+        self.market_calendar = MarketCalendar.from_env()
+        self.state_store = AutoRoleStore(AUTO_ROLE_DB_PATH)
+        self.persistence = WriteBehindPersister(self.state_store,
+                                                AUTO_ROLE_FLUSH_INTERVAL)
+        self.monday_cohort = set()  # weekend joiners awaiting the Monday activation DM
+        self.held_expiries = {}  # guild_id: keys that came due while auto-role was disabled
+        # Role adds and removals draw from one REST budget
+        self.role_rest_limiter = RateLimiter(ROLE_REST_RATE, ROLE_REST_BURST)
+        self.expiry_executor = ExpiryExecutor(self.remove_expired_role,
+                                              self.role_rest_limiter,
+                                              EXPIRY_CONCURRENCY,
+                                              self.persistence.flush)
+        self.join_pipeline = JoinPipeline(self.process_member_join,
+                                          JOIN_WORKER_CONCURRENCY)
+        self.dm_outbox = DMOutbox(self, self.state_store, DM_OUTBOX_RATE,
+                                  DM_OUTBOX_CONCURRENCY,
+                                  DM_OUTBOX_MAX_ATTEMPTS)
+        self.persistence.on_dms_flushed = self.dm_outbox.wake
+        self.broadcaster = ChannelBroadcaster(BROADCAST_CHANNEL_RATE,
+                                              BROADCAST_CHANNEL_BURST)
+        self.resolver = GuildResolverIndex(self)
+        self.signal_ledger = SignalLedger(SIGNAL_LEDGER_DB_PATH)
+        self.signal_recorder = SignalRecorder(self.signal_ledger)
+        self.outcome_tracker = OutcomeTracker(self.signal_recorder)
+        self.history_indexer = ChannelHistoryIndexer(self, self.signal_ledger,
+                                                     HISTORY_INDEX_CHANNELS,
+                                                     HISTORY_INDEX_BACKFILL_DAYS)
 
     async def setup_hook(self):
+        # Open the state store and start the write-behind flusher
+        try:
+            await asyncio.to_thread(self.state_store.open)
+        except Exception as e:
+            print(f"❌ Error opening auto-role state store: {str(e)}")
+        self.persistence.start()
+        self.join_pipeline.start()
+        self.expiry_executor.start()
+        try:
+            await self.dm_outbox.start()
+        except Exception as e:
+            print(f"❌ Error starting DM outbox: {str(e)}")
+        try:
+            await asyncio.to_thread(self.signal_ledger.open)
+            await self.signal_recorder.start()
+            # One process tracks outcomes for every guild's signals
+            price_feed = make_price_feed(PRICE_FEED) if self.runs_global_workers else None
+            if price_feed:
+                await self.outcome_tracker.start(price_feed, self.signal_ledger)
+        except Exception as e:
+            print(f"❌ Error opening signal ledger: {str(e)}")
+
         # Sync slash commands with retry mechanism for better reliability
         max_retries = 3
         for attempt in range(max_retries):
@@ -112,6 +2409,10 @@ class TradingBot(commands.Bot):
             except Exception as e:
                 print(f"⚠️ Force sync on ready failed: {e}")
 
+        # Load auto-role config if it exists (before the tasks that rely on it)
+        await self.load_auto_role_config()
+        self.reconcile_auto_role_members()
+
         # Start the role removal task
         if not self.role_removal_task.is_running():
             self.role_removal_task.start()
@@ -120,185 +2421,147 @@ class TradingBot(commands.Bot):
         if not self.weekend_activation_task.is_running():
             self.weekend_activation_task.start()
 
-        # Load auto-role config if it exists
-        await self.load_auto_role_config()
+        # Start tailing the signal channels into the history index
+        if (HISTORY_INDEX_CHANNELS and self.runs_global_workers
+                and not self.history_index_task.is_running()):
+            self.history_index_task.start()
 
         print("⚠️ Telegram integration not configured")
 
     def is_weekend_time(self, dt=None):
-        """Check if the given datetime (or now) falls within weekend trading closure"""
-        if dt is None:
-            dt = datetime.now(AMSTERDAM_TZ)
-        else:
-            dt = dt.astimezone(AMSTERDAM_TZ)
+        """Check if the given datetime (or now) falls within a market closure"""
+        return not self.market_calendar.is_open(dt)
 
-        # Weekend period: Friday 12:00 to Sunday 23:59 (Amsterdam time)
-        weekday = dt.weekday()  # Monday=0, Sunday=6
-        hour = dt.hour
+    def get_next_monday_activation_time(self):
+        """Get the next market open + 1 minute (normally Monday 00:01 Amsterdam time)"""
+        return self.market_calendar.next_open() + timedelta(minutes=1)
 
-        if weekday == 4 and hour >= 12:  # Friday from 12:00
-            return True
-        elif weekday == 5 or weekday == 6:  # Saturday or Sunday
-            return True
-        else:
-            return False
+    def get_monday_expiry_time(self, join_time):
+        """Get 23:59:59 on the first trading day after join_time (normally Monday)"""
+        first_day = self.market_calendar.next_open(join_time).date()
+        return localize_amsterdam(
+            datetime(first_day.year, first_day.month, first_day.day, 23, 59,
+                     59))
 
-    def get_next_monday_activation_time(self):
-        """Get the next Monday 00:01 Amsterdam time (when 24h countdown starts)"""
-        now = datetime.now(AMSTERDAM_TZ)
+    async def on_member_join(self, member):
+        """Queue new member joins for the auto-role join pipeline"""
+        if not is_auto_role_enabled(member.guild.id):
+            return
 
-        # Find next Monday
-        days_ahead = 0 - now.weekday()  # Monday is 0
-        if days_ahead <= 0:  # Target day already happened this week
-            days_ahead += 7
+        self.join_pipeline.enqueue(member)
 
-        next_monday = now + timedelta(days=days_ahead)
+    async def on_member_remove(self, member):
+        """Evict members who leave (or are kicked) from auto-role tracking"""
+        self.evict_member(member.guild.id, member.id, "left")
 
-        if PYTZ_AVAILABLE:
-            activation_time = AMSTERDAM_TZ.localize(
-                next_monday.replace(hour=0,
-                                    minute=1,
-                                    second=0,
-                                    microsecond=0,
-                                    tzinfo=None))
-        else:
-            activation_time = next_monday.replace(hour=0,
-                                                  minute=1,
-                                                  second=0,
-                                                  microsecond=0,
-                                                  tzinfo=AMSTERDAM_TZ)
+    async def on_member_ban(self, guild, user):
+        """Evict banned members from auto-role tracking"""
+        self.evict_member(guild.id, user.id, "was banned")
 
-        return activation_time
+    async def on_member_update(self, before, after):
+        """Recheck cached send permissions when the bot's own roles change"""
+        if after.id == self.user.id and before.roles != after.roles:
+            self.resolver.invalidate_permissions(after.guild.id)
 
-    def get_monday_expiry_time(self, join_time):
-        """Get the Monday 23:59 Amsterdam time (when weekend joiners' role expires)"""
-        now = join_time if join_time else datetime.now(AMSTERDAM_TZ)
+    async def on_guild_channel_create(self, channel):
+        self.resolver.invalidate_channels(channel.guild.id, channel.id)
 
-        if PYTZ_AVAILABLE:
-            if now.tzinfo is None:
-                now = AMSTERDAM_TZ.localize(now)
-            else:
-                now = now.astimezone(AMSTERDAM_TZ)
-        else:
-            if now.tzinfo is None:
-                now = now.replace(tzinfo=AMSTERDAM_TZ)
-            else:
-                now = now.astimezone(AMSTERDAM_TZ)
-
-        # Find next Monday
-        days_ahead = 0 - now.weekday()  # Monday is 0
-        if days_ahead <= 0:  # Target day already happened this week
-            days_ahead += 7
-
-        next_monday = now + timedelta(days=days_ahead)
-
-        if PYTZ_AVAILABLE:
-            expiry_time = AMSTERDAM_TZ.localize(
-                next_monday.replace(hour=23,
-                                    minute=59,
-                                    second=59,
-                                    microsecond=0,
-                                    tzinfo=None))
+    async def on_guild_channel_delete(self, channel):
+        self.resolver.invalidate_channels(channel.guild.id, channel.id)
+
+    async def on_guild_channel_update(self, before, after):
+        """Keep the resolver fresh after renames and permission overwrite changes"""
+        if before.name != after.name:
+            self.resolver.invalidate_channels(after.guild.id, after.id)
         else:
-            expiry_time = next_monday.replace(hour=23,
-                                              minute=59,
-                                              second=59,
-                                              microsecond=0,
-                                              tzinfo=AMSTERDAM_TZ)
+            self.resolver.invalidate_permissions(after.guild.id, after.id)
 
-        return expiry_time
+    async def on_guild_role_create(self, role):
+        self.resolver.invalidate_roles(role.guild.id)
 
-    async def on_member_join(self, member):
-        """Handle new member joins and assign auto-role if enabled"""
-        if not AUTO_ROLE_CONFIG["enabled"] or not AUTO_ROLE_CONFIG["role_id"]:
+    async def on_guild_role_delete(self, role):
+        self.resolver.invalidate_roles(role.guild.id)
+
+    async def on_guild_role_update(self, before, after):
+        self.resolver.invalidate_roles(after.guild.id)
+
+    async def on_guild_update(self, before, after):
+        self.resolver.forget_guild(after.id)
+
+    async def on_guild_remove(self, guild):
+        self.resolver.forget_guild(guild.id)
+
+    def evict_member(self, guild_id, user_id, reason):
+        """Drop a departed member's tracking, schedule, cohort entry and pending DMs"""
+        key = (guild_id, str(user_id))
+        if get_tracked_member(key) is None:
+            return
+
+        self.untrack_member(key)
+        # Pending DMs are per user, keep them while another guild still tracks them
+        if not any(key[1] in config["active_members"]
+                   for config in GUILD_AUTO_ROLE_CONFIGS.values()):
+            self.persistence.cancel_dms(user_id)
+        print(f"🚪 Member {user_id} {reason}, removed from auto-role tracking")
+
+    async def process_member_join(self, member):
+        """Assign the auto-role to a queued new member and send the welcome DM"""
+        if not is_auto_role_enabled(member.guild.id):
             return
 
+        config = get_auto_role_config(member.guild.id)
         try:
-            role = member.guild.get_role(AUTO_ROLE_CONFIG["role_id"])
+            role = member.guild.get_role(config["role_id"])
             if not role:
                 print(f"❌ Auto-role not found in guild {member.guild.name}")
                 return
 
             join_time = datetime.now(AMSTERDAM_TZ)
 
-            # Add the role immediately for all members
+            # Add the role immediately for all members (paced with the other role calls)
+            await self.role_rest_limiter.acquire()
             await member.add_roles(role, reason="Auto-role for new member")
 
-            # Check if it's weekend time to determine countdown behavior
-            if self.is_weekend_time(join_time):
-                # Weekend join - expires Monday 23:59 (not Tuesday 01:00)
-                monday_expiry = self.get_monday_expiry_time(join_time)
-
-                AUTO_ROLE_CONFIG["active_members"][str(member.id)] = {
-                    "role_added_time": join_time.isoformat(),
-                    "role_id": AUTO_ROLE_CONFIG["role_id"],
-                    "guild_id": member.guild.id,
-                    "weekend_delayed": True,
-                    "expiry_time": monday_expiry.isoformat()
-                }
-
-                # Send weekend notification DM
-                try:
-                    weekend_message = (
-                        "**Welcome to FX Pip Pioneers!** As a welcome gift, we usually give our new members "
-                        "**access to the Premium Signals channel for 24 hours.** However, the trading markets are closed right now "
-                        "because it's the weekend. We're writing to let you know that your 24 hours will start counting down from "
-                        "the moment the markets open again on Monday. This way, your welcome gift won't be wasted on the weekend "
-                        "and you'll actually be able to make use of it."
-                    )
-                    await member.send(weekend_message)
-                    print(
-                        f"✅ Sent weekend notification DM to {member.display_name}"
-                    )
-                except discord.Forbidden:
-                    print(
-                        f"⚠️ Could not send weekend notification DM to {member.display_name} (DMs disabled)"
-                    )
-                except Exception as e:
-                    print(
-                        f"❌ Error sending weekend notification DM to {member.display_name}: {str(e)}"
-                    )
+            # Weekend joins expire Monday 23:59, others get a 24-hour countdown
+            entry = self.new_tracking_entry(member.guild.id, config["role_id"],
+                                            join_time)
+            config["active_members"][str(member.id)] = entry
+
+            if entry.weekend_delayed:
+                # Queue weekend notification DM (committed with the member row)
+                weekend_message = (
+                    "**Welcome to FX Pip Pioneers!** As a welcome gift, we usually give our new members "
+                    "**access to the Premium Signals channel for 24 hours.** However, the trading markets are closed right now "
+                    "because it's the weekend. We're writing to let you know that your 24 hours will start counting down from "
+                    "the moment the markets open again on Monday. This way, your welcome gift won't be wasted on the weekend "
+                    "and you'll actually be able to make use of it."
+                )
+                self.dm_outbox.queue_with_state(self.persistence, member.id,
+                                                "weekend notification",
+                                                weekend_message)
 
                 print(
                     f"✅ Auto-role '{role.name}' added to {member.display_name} (expires Monday 23:59)"
                 )
 
             else:
-                # Normal join - immediate 24-hour countdown
-                AUTO_ROLE_CONFIG["active_members"][str(member.id)] = {
-                    "role_added_time": join_time.isoformat(),
-                    "role_id": AUTO_ROLE_CONFIG["role_id"],
-                    "guild_id": member.guild.id,
-                    "weekend_delayed": False
-                }
-
-                # Send weekday welcome DM
-                try:
-                    weekday_message = (
-                        "**:star2: Welcome to FX Pip Pioneers! :star2:**\n\n"
-                        ":white_check_mark: As a welcome gift, we've given you access to our **Premium Signals channel for 24 hours.** "
-                        "That means you can start profiting from the **8–10 trade signals** we send per day right now!\n\n"
-                        "***This is your shot at consistency, clarity, and growth in trading. Let's level up together!***"
-                    )
-                    await member.send(weekday_message)
-                    print(
-                        f"✅ Sent weekday welcome DM to {member.display_name}"
-                    )
-                except discord.Forbidden:
-                    print(
-                        f"⚠️ Could not send weekday welcome DM to {member.display_name} (DMs disabled)"
-                    )
-                except Exception as e:
-                    print(
-                        f"❌ Error sending weekday welcome DM to {member.display_name}: {str(e)}"
-                    )
+                # Queue weekday welcome DM (committed with the member row)
+                weekday_message = (
+                    "**:star2: Welcome to FX Pip Pioneers! :star2:**\n\n"
+                    ":white_check_mark: As a welcome gift, we've given you access to our **Premium Signals channel for 24 hours.** "
+                    "That means you can start profiting from the **8–10 trade signals** we send per day right now!\n\n"
+                    "***This is your shot at consistency, clarity, and growth in trading. Let's level up together!***"
+                )
+                self.dm_outbox.queue_with_state(self.persistence, member.id,
+                                                "weekday welcome",
+                                                weekday_message)
 
                 print(
                     f"✅ Auto-role '{role.name}' added to {member.display_name} (24h countdown starts now)"
                 )
 
-            # Save the updated config
-            await self.save_auto_role_config()
+            # Schedule the new deadline and queue the member row for saving
+            self.track_member((member.guild.id, str(member.id)))
 
         except discord.Forbidden:
             print(f"❌ No permission to assign role to {member.display_name}")
@@ -307,194 +2570,331 @@ class TradingBot(commands.Bot):
                 f"❌ Error assigning auto-role to {member.display_name}: {str(e)}"
             )
 
+    def new_tracking_entry(self, guild_id, role_id, start_time):
+        """Tracking record for a member who received the auto-role at start_time"""
+        # Check if it's weekend time to determine countdown behavior
+        if self.is_weekend_time(start_time):
+            # Weekend join - expires Monday 23:59 (not Tuesday 01:00)
+            return TrackedMember(
+                guild_id, role_id, start_time.timestamp(),
+                self.get_monday_expiry_time(start_time).timestamp(),
+                TrackedMember.WEEKEND)
+        return TrackedMember(guild_id, role_id, start_time.timestamp(),
+                             start_time.timestamp() + 24 * 3600)
+
+    def new_manual_tracking_entry(self, guild_id, role_id, timing, start_time,
+                                  custom_hours=0, custom_minutes=0):
+        """Tracking record for a manual add with 24hours, weekend or custom timing"""
+        if timing == "weekend":
+            # Weekend timing - expires Monday 23:59
+            return TrackedMember(
+                guild_id, role_id, start_time.timestamp(),
+                self.get_monday_expiry_time(start_time).timestamp(),
+                TrackedMember.WEEKEND)
+        if timing == "custom":
+            # Use weekend logic for custom timing
+            return TrackedMember(guild_id, role_id, start_time.timestamp(),
+                                 start_time.timestamp() + custom_hours * 3600 +
+                                 custom_minutes * 60,
+                                 TrackedMember.WEEKEND | TrackedMember.CUSTOM)
+        return TrackedMember(guild_id, role_id, start_time.timestamp(),
+                             start_time.timestamp() + 24 * 3600)
+
+    def reconcile_auto_role_members(self):
+        """Repair drift between tracked members and the actual auto-role holders
+
+        Uses one pass over each role's member list: tracked members without the
+        role are dropped and tracked holders whose expiry already passed are
+        expired right away. Holders the bot never tracked are only reported,
+        unless RECONCILE_ADOPT_UNTRACKED gives them a countdown starting now.
+        """
+        now = datetime.now(AMSTERDAM_TZ)
+        catch_up = []
+        for guild_id, config in list(GUILD_AUTO_ROLE_CONFIGS.items()):
+            guild = self.get_guild(guild_id)
+            if not is_auto_role_enabled(guild_id) or not guild:
+                continue
+            role = guild.get_role(config["role_id"])
+            if not role:
+                continue
+
+            holders = {str(member.id) for member in role.members}
+            tracked = {
+                member_id
+                for member_id, data in config["active_members"].items()
+                if data.role_id == role.id
+            }
+
+            stale = tracked - holders  # Left the guild or role removed by hand
+            for member_id in stale:
+                self.untrack_member((guild_id, member_id))
+
+            untracked = holders - tracked  # Role given outside the bot
+            if RECONCILE_ADOPT_UNTRACKED:
+                for member_id in untracked:
+                    config["active_members"][member_id] = self.new_tracking_entry(
+                        guild_id, role.id, now)
+                    self.track_member((guild_id, member_id))
+
+            overdue = 0
+            for member_id in tracked & holders:
+                key = (guild_id, member_id)
+                if config["active_members"][member_id].expiry_ts <= now.timestamp():
+                    self.expiry_scheduler.cancel(key)
+                    catch_up.append(key)
+                    overdue += 1
+
+            if stale or untracked or overdue:
+                print(
+                    f"🔍 Reconciled {guild.name}: {len(holders)} role holder(s), "
+                    f"{len(stale)} stale dropped, {len(untracked)} untracked "
+                    f"{'adopted' if RECONCILE_ADOPT_UNTRACKED else 'left alone'}, "
+                    f"{overdue} missed expiries queued")
+
+        self.expiry_executor.submit(catch_up)
+
+    @property
+    def runs_global_workers(self):
+        """Whether this process runs the workers that are not tied to a guild (shard 0's process)"""
+        return self.shard_ids is None or 0 in self.shard_ids
+
     async def load_auto_role_config(self):
-        """Load auto-role configuration from file if it exists"""
+        """Load the per-guild auto-role configuration for this process's shards"""
+        # Make sure nothing pending is overwritten by the reload
+        await self.persistence.flush()
         try:
-            if os.path.exists("auto_role_config.json"):
-                with open("auto_role_config.json", "r") as f:
-                    loaded_config = json.load(f)
-                    AUTO_ROLE_CONFIG.update(loaded_config)
-                print("✅ Auto-role configuration loaded")
+            settings, active_members = await asyncio.to_thread(
+                self.state_store.load, self.shard_count, self.shard_ids)
+            GUILD_AUTO_ROLE_CONFIGS.clear()
+            for guild_id, guild_settings in settings.items():
+                get_auto_role_config(guild_id).update(guild_settings)
+            for guild_id, members in active_members.items():
+                get_auto_role_config(guild_id)["active_members"] = members
+
+            await self.adopt_legacy_auto_role_config()
+            print(
+                f"✅ Auto-role configuration loaded for {len(GUILD_AUTO_ROLE_CONFIGS)} guild(s)"
+            )
         except Exception as e:
             print(f"⚠️ Error loading auto-role config: {str(e)}")
 
-    async def save_auto_role_config(self):
-        """Save auto-role configuration to file"""
-        try:
-            with open("auto_role_config.json", "w") as f:
-                json.dump(AUTO_ROLE_CONFIG, f, indent=2)
-        except Exception as e:
-            print(f"❌ Error saving auto-role config: {str(e)}")
-
-    @tasks.loop(seconds=30)  # Check every 30 seconds for instant role removal
-    async def role_removal_task(self):
-        """Background task to remove expired roles and send DMs"""
-        if not AUTO_ROLE_CONFIG["enabled"] or not AUTO_ROLE_CONFIG[
-                "active_members"]:
+        # Rebuild the expiry schedule and Monday cohort from the tracked members
+        self.expiry_scheduler.clear()
+        self.expiry_index.clear()
+        self.monday_cohort.clear()
+        self.held_expiries.clear()
+        for guild_id, config in GUILD_AUTO_ROLE_CONFIGS.items():
+            for member_id in list(config["active_members"].keys()):
+                self.schedule_member_expiry((guild_id, member_id))
+                self.index_monday_cohort((guild_id, member_id))
+
+    async def adopt_legacy_auto_role_config(self):
+        """Hand settings saved before per-guild configs to the guild owning their role"""
+        legacy_config = GUILD_AUTO_ROLE_CONFIGS.get(LEGACY_GUILD_ID)
+        if not legacy_config:
             return
 
-        current_time = datetime.now(AMSTERDAM_TZ)
-        expired_members = []
-
-        for member_id, data in AUTO_ROLE_CONFIG["active_members"].items():
-            try:
-                # Handle weekend delayed members with custom expiry time
-                if data.get("weekend_delayed",
-                            False) and "expiry_time" in data:
-                    # Weekend joiners have specific expiry time (Monday 23:59)
-                    expiry_time = datetime.fromisoformat(data["expiry_time"])
-                    if expiry_time.tzinfo is None:
-                        if PYTZ_AVAILABLE:
-                            expiry_time = AMSTERDAM_TZ.localize(expiry_time)
-                        else:
-                            expiry_time = expiry_time.replace(
-                                tzinfo=AMSTERDAM_TZ)
-                    else:
-                        expiry_time = expiry_time.astimezone(AMSTERDAM_TZ)
-                else:
-                    # Normal members - 24 hours from role_added_time
-                    role_added_time = datetime.fromisoformat(
-                        data["role_added_time"])
-                    if role_added_time.tzinfo is None:
-                        if PYTZ_AVAILABLE:
-                            role_added_time = AMSTERDAM_TZ.localize(
-                                role_added_time)
-                        else:
-                            role_added_time = role_added_time.replace(
-                                tzinfo=AMSTERDAM_TZ)
-                    else:
-                        role_added_time = role_added_time.astimezone(
-                            AMSTERDAM_TZ)
+        owner = next((guild for guild in self.guilds
+                      if legacy_config["role_id"]
+                      and guild.get_role(legacy_config["role_id"])), None)
+        if not owner:
+            return
 
-                    expiry_time = role_added_time + timedelta(hours=24)
+        await asyncio.to_thread(self.state_store.adopt_legacy_settings,
+                                owner.id)
+        del GUILD_AUTO_ROLE_CONFIGS[LEGACY_GUILD_ID]
+        config = get_auto_role_config(owner.id)
+        for key in AUTO_ROLE_SETTING_KEYS:
+            if key in legacy_config:
+                config[key] = legacy_config[key]
+        config["active_members"].update(legacy_config["active_members"])
+        print(f"✅ Legacy auto-role settings adopted by guild {owner.name}")
+
+    def schedule_member_expiry(self, key):
+        """Hand a tracked member's expiry to the expiry scheduler and list index"""
+        data = get_tracked_member(key)
+        if not data:
+            self.expiry_scheduler.cancel(key)
+            self.expiry_index.remove(key)
+            return
 
-                if current_time >= expiry_time:
-                    expired_members.append(member_id)
+        self.expiry_scheduler.schedule(key, data.expiry_ts)
+        self.expiry_index.update(key, data.expiry_ts, member_expiry_kind(data))
 
-            except Exception as e:
-                print(f"❌ Error processing member {member_id}: {str(e)}")
-                expired_members.append(member_id)  # Remove corrupted entries
+    def save_auto_role_config(self, guild_id):
+        """Queue a guild's auto-role settings for the next write-behind flush"""
+        self.persistence.mark_settings(guild_id)
 
-        # Process expired members
-        for member_id in expired_members:
-            await self.remove_expired_role(member_id)
+    def index_monday_cohort(self, key):
+        """Add or drop a member from the pending Monday activation cohort"""
+        data = get_tracked_member(key)
+        if (data and data.weekend_delayed and not data.custom_duration
+                and not data.monday_notification_sent):
+            self.monday_cohort.add(key)
+        else:
+            self.monday_cohort.discard(key)
+
+    def track_member(self, key):
+        """Reschedule and persist a tracked member after its entry changed"""
+        self.expiry_executor.discard(key)
+        self.schedule_member_expiry(key)
+        self.index_monday_cohort(key)
+        self.persistence.mark_member(key)
+
+    def untrack_member(self, key):
+        """Stop tracking a member and queue its row for deletion"""
+        guild_id, member_id = key
+        config = GUILD_AUTO_ROLE_CONFIGS.get(guild_id)
+        if config:
+            config["active_members"].pop(member_id, None)
+        self.expiry_scheduler.cancel(key)
+        self.expiry_index.remove(key)
+        self.expiry_executor.discard(key)
+        self.held_expiries.get(guild_id, set()).discard(key)
+        self.monday_cohort.discard(key)
+        self.persistence.mark_deleted(key)
+
+    def release_held_expiries(self, guild_id):
+        """Hand expiries that came due while a guild's auto-role was disabled to the executor"""
+        held = self.held_expiries.pop(guild_id, None)
+        if held:
+            self.expiry_executor.submit(held)
+
+    @tasks.loop(seconds=0)  # Sleeps on the expiry scheduler until the next deadline
+    async def role_removal_task(self):
+        """Background task to remove expired roles and send DMs"""
+        await self.expiry_scheduler.wait_until_due()
+
+        # Hand expired members to the paced executor so this loop never stalls
+        due = []
+        for key in self.expiry_scheduler.pop_due():
+            guild_id = key[0]
+            if GUILD_AUTO_ROLE_CONFIGS.get(guild_id, {}).get("enabled"):
+                due.append(key)
+            else:
+                # Hold them until auto-role is enabled again for the guild
+                self.held_expiries.setdefault(guild_id, set()).add(key)
+        self.expiry_executor.submit(due)
 
-        # Save updated config if there were changes
-        if expired_members:
-            await self.save_auto_role_config()
+    @tasks.loop(minutes=HISTORY_INDEX_INTERVAL_MINUTES)
+    async def history_index_task(self):
+        """Background task that indexes new signal channel messages"""
+        await self.history_indexer.run()
 
-    @tasks.loop(
-        minutes=1)  # Check every minute for Monday activation notifications
+    @tasks.loop(seconds=0)  # Sleeps until the next Monday market open
     async def weekend_activation_task(self):
         """Background task to send Monday activation DMs for weekend joiners"""
-        if not AUTO_ROLE_CONFIG["enabled"] or not AUTO_ROLE_CONFIG[
-                "active_members"]:
-            return
-
         current_time = datetime.now(AMSTERDAM_TZ)
-        weekday = current_time.weekday()  # Monday=0
-        hour = current_time.hour
+        session_open = self.market_calendar.session_open(current_time)
+
+        # Fire at market open, or catch up if the bot restarted early on Monday
+        if session_open and current_time - session_open < timedelta(
+                hours=MONDAY_ACTIVATION_WINDOW_HOURS):
+            await self.activate_monday_cohort()
+
+        await discord.utils.sleep_until(
+            self.get_next_monday_activation_time())
 
-        # Only run on Monday between 00:00 and 01:00 to send activation messages
-        if weekday != 0 or hour > 1:
+    async def activate_monday_cohort(self):
+        """Queue the Monday activation DM for every pending weekend joiner
+
+        The NOTIFIED flag is set in memory first and both the flags and the DMs
+        go through the write-behind persister, so they land in one commit and a
+        restart either sees the whole cohort as pending or has it in the outbox.
+        """
+        if not self.monday_cohort:
             return
 
-        for member_id, data in AUTO_ROLE_CONFIG["active_members"].items():
+        queued = notified = 0
+        for key in list(self.monday_cohort):
+            guild_id, member_id = key
             try:
-                # Only process weekend delayed members who haven't been notified yet
-                if (data.get("weekend_delayed", False)
-                        and not data.get("monday_notification_sent", False)):
-
-                    guild = self.get_guild(data["guild_id"])
-                    if guild:
-                        member = guild.get_member(int(member_id))
-                        if member:
-                            try:
-                                activation_message = (
-                                    "Hey! The weekend is over and the markets are now open. "
-                                    "That means your 24-hour welcome gift has officially started. "
-                                    "You now have full access to the premium channel. "
-                                    "Let's make the most of it by securing some wins together!"
-                                )
-                                await member.send(activation_message)
-                                print(
-                                    f"✅ Sent Monday activation DM to {member.display_name}"
-                                )
-
-                                # Mark as notified to avoid duplicate messages
-                                AUTO_ROLE_CONFIG["active_members"][member_id][
-                                    "monday_notification_sent"] = True
-                                await self.save_auto_role_config()
-
-                            except discord.Forbidden:
-                                print(
-                                    f"⚠️ Could not send Monday activation DM to {member.display_name} (DMs disabled)"
-                                )
-                            except Exception as e:
-                                print(
-                                    f"❌ Error sending Monday activation DM to {member.display_name}: {str(e)}"
-                                )
+                data = get_tracked_member(key)
+                if not data:
+                    self.monday_cohort.discard(key)
+                    continue
+                if not is_auto_role_enabled(guild_id):
+                    continue
+
+                guild = self.get_guild(guild_id)
+                member = guild.get_member(int(member_id)) if guild else None
+                if not member:
+                    continue  # Left members are cleaned up on expiry
+
+                GUILD_AUTO_ROLE_CONFIGS[guild_id]["active_members"][member_id] = \
+                    data.with_flags(TrackedMember.NOTIFIED)
+                self.persistence.mark_member(key)
+                self.monday_cohort.discard(key)
+                notified += 1
+                if self.dm_outbox.queue_with_state(self.persistence, member.id,
+                                                   "Monday activation",
+                                                   MONDAY_ACTIVATION_MESSAGE):
+                    queued += 1
 
             except Exception as e:
                 print(
                     f"❌ Error processing Monday activation for member {member_id}: {str(e)}"
                 )
 
-    async def remove_expired_role(self, member_id):
-        """Remove expired role from member and send DM"""
+        if notified:
+            print(f"✅ Queued Monday activation DMs for {queued} weekend joiner(s)")
+
+    async def remove_expired_role(self, key):
+        """Remove expired role from member and send DM, returning the outcome"""
+        guild_id, member_id = key
         try:
-            data = AUTO_ROLE_CONFIG["active_members"].get(member_id)
+            data = get_tracked_member(key)
             if not data:
-                return
+                return "untracked"
 
             # Get the guild and member
-            guild = self.get_guild(data["guild_id"])
+            guild = self.get_guild(guild_id)
             if not guild:
                 print(f"❌ Guild not found for member {member_id}")
-                del AUTO_ROLE_CONFIG["active_members"][member_id]
-                return
+                self.untrack_member(key)
+                return "guild missing"
 
             member = guild.get_member(int(member_id))
             if not member:
                 print(f"❌ Member {member_id} not found in guild")
-                del AUTO_ROLE_CONFIG["active_members"][member_id]
-                return
+                self.untrack_member(key)
+                return "left"
 
             # Get the role
-            role = guild.get_role(data["role_id"])
+            role = guild.get_role(data.role_id)
             if role and role in member.roles:
                 await member.remove_roles(role, reason="Auto-role expired")
                 print(
                     f"✅ Removed expired role '{role.name}' from {member.display_name}"
                 )
 
-            # Send DM to the member with the default message
-            try:
-                default_message = "Hey! Your **24-hour free access** to the premium channel has unfortunately **ran out**. We truly hope you were able to benefit with us & we hope to see you back soon! For now, feel free to continue following our trade signals in the regular channels."
-                await member.send(default_message)
-                print(f"✅ Sent expiration DM to {member.display_name}")
-            except discord.Forbidden:
-                print(
-                    f"⚠️ Could not send DM to {member.display_name} (DMs disabled)"
-                )
-            except Exception as e:
-                print(f"❌ Error sending DM to {member.display_name}: {str(e)}")
+            # Queue DM to the member with the default message (committed with the batch)
+            default_message = "Hey! Your **24-hour free access** to the premium channel has unfortunately **ran out**. We truly hope you were able to benefit with us & we hope to see you back soon! For now, feel free to continue following our trade signals in the regular channels."
+            self.dm_outbox.queue_with_state(self.persistence, member.id,
+                                            "expiration", default_message)
 
             # Remove from active tracking
-            del AUTO_ROLE_CONFIG["active_members"][member_id]
+            self.untrack_member(key)
+            return "expired"
 
         except Exception as e:
             print(
                 f"❌ Error removing expired role for member {member_id}: {str(e)}"
             )
             # Clean up corrupted entry
-            if member_id in AUTO_ROLE_CONFIG["active_members"]:
-                del AUTO_ROLE_CONFIG["active_members"][member_id]
+            self.untrack_member(key)
+            return "error"
 
 
 bot = TradingBot()
 
+# Default TP/SL ladder: distances in pips from the entry
+DEFAULT_LADDER = {'mode': 'pips', 'tp': (20, 50, 100), 'sl': 70}
+
 # Trading pair configurations
+# A pair may override the ladder with 'ladder' and add a 'swing' ladder for swing
+# entries. Ladders take any number of TPs, either in pips ({'mode': 'pips'}) or
+# as ATR multiples ({'mode': 'atr', 'atr': <price distance>, 'tp': ..., 'sl': ...}).
 PAIR_CONFIG = {
     'XAUUSD': {
         'decimals': 2,
@@ -587,117 +2987,330 @@ PAIR_CONFIG = {
 }
 
 
-def calculate_levels(entry_price: float, pair: str, entry_type: str):
-    """Calculate TP and SL levels based on pair configuration"""
-    if pair in PAIR_CONFIG:
-        pip_value = PAIR_CONFIG[pair]['pip_value']
-        decimals = PAIR_CONFIG[pair]['decimals']
-    else:
-        # Default values for unknown pairs
-        pip_value = 0.0001
-        decimals = 4
-
-    # Calculate pip amounts
-    tp1_pips = 20 * pip_value
-    tp2_pips = 50 * pip_value
-    tp3_pips = 100 * pip_value
-    sl_pips = 70 * pip_value
-
-    # Determine direction based on entry type
-    is_buy = entry_type.lower().startswith('buy')
-
-    if is_buy:
-        tp1 = entry_price + tp1_pips
-        tp2 = entry_price + tp2_pips
-        tp3 = entry_price + tp3_pips
-        sl = entry_price - sl_pips
-    else:  # Sell
-        tp1 = entry_price - tp1_pips
-        tp2 = entry_price - tp2_pips
-        tp3 = entry_price - tp3_pips
-        sl = entry_price + sl_pips
-
-    # Format prices with correct decimals
-    if pair == 'XAUUSD' or pair == 'US500':
-        currency_symbol = '$'
-    elif pair == 'US100':
-        currency_symbol = '$'
-    else:
-        currency_symbol = '$'
+def parse_entry_type(entry_type: str):
+    """Return (is_buy, is_swing) for an entry type such as 'Buy limit' or 'Short Swing'"""
+    entry_type = entry_type.lower()
+    return entry_type.startswith('buy'), 'swing' in entry_type
 
-    def format_price(price):
-        return f"{currency_symbol}{price:.{decimals}f}"
 
-    return {
-        'tp1': format_price(tp1),
-        'tp2': format_price(tp2),
-        'tp3': format_price(tp3),
-        'sl': format_price(sl),
-        'entry': format_price(entry_price)
+class PairLadder:
+    """A pair's TP/SL ladder compiled to price distances, with its price formatter"""
+
+    __slots__ = ("pair", "decimals", "mode", "tp", "sl", "atr", "format_price")
+
+    def __init__(self, pair, config, ladder):
+        self.pair = pair
+        self.decimals = config['decimals']
+        self.mode = ladder.get('mode', 'pips')
+        if self.mode == 'pips':
+            pip_value = config['pip_value']
+            self.tp = tuple(pips * pip_value for pips in ladder['tp'])
+            self.sl = ladder['sl'] * pip_value
+            self.atr = None
+        elif self.mode == 'atr':
+            self.tp = tuple(ladder['tp'])  # ATR multiples
+            self.sl = ladder['sl']
+            self.atr = ladder.get('atr')  # default ATR in price units
+        else:
+            raise ValueError(f"Unknown ladder mode '{self.mode}' for {pair}")
+        self.format_price = f"${{:.{self.decimals}f}}".format
+
+    def distances(self, atr=None):
+        """TP distances and SL distance in price units"""
+        if self.mode == 'pips':
+            return self.tp, self.sl
+        atr = self.atr if atr is None else atr
+        if not atr:
+            raise ValueError(f"{self.pair} uses ATR distances, an ATR value is required")
+        return tuple(multiple * atr for multiple in self.tp), self.sl * atr
+
+
+class LevelEngine:
+    """Computes TP/SL levels from PAIR_CONFIG ladders, compiled once per pair"""
+
+    def __init__(self, pair_config):
+        self.pair_config = pair_config
+        self._ladders = {}  # (pair, is_swing): PairLadder
+
+    def invalidate(self):
+        """Drop compiled ladders after PAIR_CONFIG changed"""
+        self._ladders.clear()
+
+    def ladder(self, pair, swing=False):
+        key = (pair.upper(), swing)
+        compiled = self._ladders.get(key)
+        if compiled is None:
+            config = self.pair_config.get(key[0])
+            if config is None:
+                raise ValueError(f"Unknown pair {pair}, add it to PAIR_CONFIG")
+            ladder = (config.get('swing') if swing else None) or config.get(
+                'ladder', DEFAULT_LADDER)
+            compiled = self._ladders[key] = PairLadder(key[0], config, ladder)
+        return compiled
+
+    def levels(self, entry_price, pair, entry_type, atr=None):
+        """Numeric levels: {'entry': float, 'tps': [float, ...], 'sl': float}"""
+        is_buy, swing = parse_entry_type(entry_type)
+        ladder = self.ladder(pair, swing)
+        tp_distances, sl_distance = ladder.distances(atr)
+        sign = 1 if is_buy else -1
+        return {
+            'entry': entry_price,
+            'tps': [round(entry_price + sign * distance, ladder.decimals)
+                    for distance in tp_distances],
+            'sl': round(entry_price - sign * sl_distance, ladder.decimals)
+        }
+
+    def levels_batch(self, entry_prices, pair, entry_type, atr=None, ladder=None):
+        """Levels for many entries (or candidate prices) of one pair in one call
+
+        atr may be a single value or one per entry, and ladder a PairLadder to
+        use instead of the pair's configured one. With NumPy the result holds
+        arrays: 'entry' (n,), 'tps' (n, number of TPs) and 'sl' (n,); without
+        it, the same layout as lists.
+        """
+        if not NUMPY_AVAILABLE:
+            if atr is None or not hasattr(atr, '__len__'):
+                atr = [atr] * len(entry_prices)
+            rows = [self.levels(price, pair, entry_type, row_atr)
+                    for price, row_atr in zip(entry_prices, atr)]
+            return {
+                'entry': list(entry_prices),
+                'tps': [row['tps'] for row in rows],
+                'sl': [row['sl'] for row in rows]
+            }
+
+        is_buy, swing = parse_entry_type(entry_type)
+        ladder = ladder or self.ladder(pair, swing)
+        entries = np.asarray(entry_prices, dtype=float)
+        sign = 1.0 if is_buy else -1.0
+        if ladder.mode == 'pips':
+            tp_distances = np.asarray(ladder.tp)
+            sl_distance = ladder.sl
+        else:
+            atr = np.asarray(ladder.atr if atr is None else atr, dtype=float)
+            if not atr.all():
+                raise ValueError(f"{pair} uses ATR distances, an ATR value is required")
+            tp_distances = np.multiply.outer(atr, ladder.tp)  # (k,) or (n, k)
+            sl_distance = atr * ladder.sl
+        return {
+            'entry': entries,
+            'tps': np.round(entries[:, None] + sign * tp_distances,
+                            ladder.decimals),
+            'sl': np.round(entries - sign * sl_distance, ladder.decimals)
+        }
+
+
+LEVEL_ENGINE = LevelEngine(PAIR_CONFIG)
+
+
+def calculate_levels(entry_price: float, pair: str, entry_type: str):
+    """Calculate formatted TP and SL levels based on pair configuration
+
+    Returns 'entry', 'sl', 'tps' (every TP in order) and 'tp1'...'tpN'.
+    """
+    is_buy, swing = parse_entry_type(entry_type)
+    format_price = LEVEL_ENGINE.ladder(pair, swing).format_price
+    levels = LEVEL_ENGINE.levels(entry_price, pair, entry_type)
+
+    formatted = {
+        'entry': format_price(entry_price),
+        'sl': format_price(levels['sl']),
+        'tps': [format_price(tp) for tp in levels['tps']]
     }
+    for number, tp in enumerate(formatted['tps'], start=1):
+        formatted[f'tp{number}'] = tp
+    return formatted
 
 
-def get_remaining_time_display(member_id: str) -> str:
-    """Get formatted remaining time display for a member"""
+def get_remaining_time_display(key: tuple) -> str:
+    """Get formatted remaining time display for a (guild_id, member_id) key"""
+    guild_id, member_id = key
     try:
-        data = AUTO_ROLE_CONFIG["active_members"].get(member_id)
+        data = get_tracked_member(key)
         if not data:
             return "Unknown"
 
-        current_time = datetime.now(AMSTERDAM_TZ)
+        time_remaining = data.expiry_ts - time.time()
+        if time_remaining <= 0:
+            return None  # Return None for expired members to filter them out
 
-        if data.get("weekend_delayed", False) and "expiry_time" in data:
-            # Weekend joiners have specific expiry time (Monday 23:59)
-            expiry_time = datetime.fromisoformat(data["expiry_time"])
-            if expiry_time.tzinfo is None:
-                if PYTZ_AVAILABLE:
-                    expiry_time = AMSTERDAM_TZ.localize(expiry_time)
-                else:
-                    expiry_time = expiry_time.replace(tzinfo=AMSTERDAM_TZ)
-            else:
-                expiry_time = expiry_time.astimezone(AMSTERDAM_TZ)
-            
-            time_remaining = expiry_time - current_time
-            
-            if time_remaining.total_seconds() <= 0:
-                return None  # Return None for expired members to filter them out
-            
-            hours = int(time_remaining.total_seconds() // 3600)
-            minutes = int((time_remaining.total_seconds() % 3600) // 60)
-            seconds = int(time_remaining.total_seconds() % 60)
-            
-            # Check if it's a custom duration
-            if data.get("custom_duration", False):
-                return f"Custom: {hours}h {minutes}m {seconds}s"
-            else:
-                return f"Weekend: {hours}h {minutes}m {seconds}s"
-            
-        else:
-            # Normal member - 24 hours from role_added_time
-            role_added_time = datetime.fromisoformat(data["role_added_time"])
-            if role_added_time.tzinfo is None:
-                if PYTZ_AVAILABLE:
-                    role_added_time = AMSTERDAM_TZ.localize(role_added_time)
-                else:
-                    role_added_time = role_added_time.replace(tzinfo=AMSTERDAM_TZ)
-            else:
-                role_added_time = role_added_time.astimezone(AMSTERDAM_TZ)
+        return format_time_remaining(time_remaining, member_expiry_kind(data))
 
-            expiry_time = role_added_time + timedelta(hours=24)
-            time_remaining = expiry_time - current_time
+    except Exception as e:
+        print(f"Error calculating time for member {member_id}: {str(e)}")
+        return "ERROR"
 
-            if time_remaining.total_seconds() <= 0:
-                return None  # Return None for expired members to filter them out
 
-            hours = int(time_remaining.total_seconds() // 3600)
-            minutes = int((time_remaining.total_seconds() % 3600) // 60)
-            seconds = int(time_remaining.total_seconds() % 60)
+def format_time_remaining(total_seconds, kind):
+    """Format seconds left on a temporary role, prefixed by its timing kind"""
+    hours = int(total_seconds // 3600)
+    minutes = int((total_seconds % 3600) // 60)
+    seconds = int(total_seconds % 60)
+    remaining = f"{hours}h {minutes}m {seconds}s"
+
+    if kind == "custom":
+        return f"Custom: {remaining}"
+    if kind == "weekend":
+        return f"Weekend: {remaining}"
+    return remaining
+
+
+class AutoRoleListView(discord.ui.View):
+    """Pages through a guild's temporary role members, soonest expiry first"""
+
+    def __init__(self, guild, kind=None):
+        super().__init__(timeout=300)
+        self.guild = guild
+        self.kind = kind
+        self.page = 0
+
+    def render(self):
+        """Build the current page; only the rows on this page are touched"""
+        now_ts = time.time()
+        total = bot.expiry_index.count(self.guild.id, self.kind, now_ts)
+        page_count = max(1, -(-total // AUTO_ROLE_LIST_PAGE_SIZE))
+        self.page = min(self.page, page_count - 1)
+        rows = bot.expiry_index.page(self.guild.id, self.kind, self.page,
+                                     now_ts=now_ts)
+
+        config = get_auto_role_config(self.guild.id)
+        role = self.guild.get_role(
+            config["role_id"]) if config["role_id"] else None
+        role_name = role.name if role else "Unknown Role"
+
+        member_list = []
+        for expiry_ts, member_id in rows:
+            member = self.guild.get_member(int(member_id))
+            name = member.display_name if member else f"<@{member_id}>"
+            data = get_tracked_member((self.guild.id, member_id))
+            kind = member_expiry_kind(data) if data else "24hours"
+            member_list.append(
+                f"• {name} - {format_time_remaining(expiry_ts - now_ts, kind)}")
+
+        list_message = "📋 **Active Temporary Role Members**\n"
+        list_message += f"**Role:** {role_name}\n"
+        if self.kind:
+            list_message += f"**Filter:** {self.kind}\n"
+        list_message += "**Duration:** 24 hours (fixed)\n\n"
+        list_message += "\n".join(
+            member_list) or "📝 No members currently have temporary roles."
+        list_message += f"\n\nPage {self.page + 1}/{page_count} • {total} member(s)"
+
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= page_count - 1
+        return list_message
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction,
+                            button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await interaction.response.edit_message(content=self.render(),
+                                                view=self)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction,
+                        button: discord.ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(content=self.render(),
+                                                view=self)
+
+
+def parse_auto_role_import(text, guild, config, role):
+    """Validate an import CSV up front, returning (rows, skipped, errors)
+
+    Each line is user_id[,timing[,custom_hours[,custom_minutes]]] with timing
+    24hours (default), weekend or custom; a header line is allowed.
+    """
+    rows, errors = [], []
+    skipped = 0
+    seen = set()
+    for line_number, fields in enumerate(csv.reader(io.StringIO(text)),
+                                         start=1):
+        fields = [field.strip() for field in fields]
+        if not any(fields):
+            continue
+        user_value = fields[0].strip("<@!>")
+        if line_number == 1 and not user_value.isdigit():
+            continue  # Header line
+
+        if len(rows) + skipped + len(errors) >= BULK_IMPORT_MAX_ROWS:
+            errors.append(f"more than {BULK_IMPORT_MAX_ROWS} rows")
+            break
+
+        timing = fields[1].lower() if len(fields) > 1 and fields[1] else "24hours"
+        try:
+            hours = int(fields[2]) if len(fields) > 2 and fields[2] else 0
+            minutes = int(fields[3]) if len(fields) > 3 and fields[3] else 0
+        except ValueError:
+            errors.append(f"line {line_number}: custom duration must be whole numbers")
+            continue
+
+        if not user_value.isdigit():
+            errors.append(f"line {line_number}: invalid user ID '{fields[0]}'")
+        elif timing not in AUTO_ROLE_LIST_KINDS:
+            errors.append(f"line {line_number}: timing must be 24hours, weekend or custom")
+        elif timing == "custom" and not (0 <= hours <= 168 and 0 <= minutes <= 59
+                                         and hours * 60 + minutes > 0):
+            errors.append(f"line {line_number}: custom duration must be 1 minute to 168 hours")
+        else:
+            member = guild.get_member(int(user_value))
+            if not member:
+                errors.append(f"line {line_number}: user {user_value} is not in this server")
+            elif (user_value in seen or user_value in config["active_members"]
+                  or role in member.roles):
+                skipped += 1  # Duplicate, already tracked or already has the role
+            else:
+                seen.add(user_value)
+                rows.append((member, timing, hours, minutes))
+    return rows, skipped, errors
+
+
+async def run_auto_role_import(interaction, config, role, rows):
+    """Grant the role to validated import rows, then track them in one commit"""
+    guild_id = interaction.guild.id
+    semaphore = asyncio.Semaphore(BULK_IMPORT_CONCURRENCY)
+    granted = {}  # member_id: TrackedMember
+    failures = collections.Counter()
+    processed = 0
+    last_progress = time.monotonic()
+
+    async def grant(member, timing, hours, minutes):
+        nonlocal processed, last_progress
+        async with semaphore:
+            await bot.role_rest_limiter.acquire()
+            try:
+                await member.add_roles(
+                    role, reason="Bulk import via /timedautorole import")
+                granted[str(member.id)] = bot.new_manual_tracking_entry(
+                    guild_id, role.id, timing, datetime.now(AMSTERDAM_TZ),
+                    hours, minutes)
+            except discord.Forbidden:
+                failures["missing permissions"] += 1
+            except discord.NotFound:
+                failures["left the server"] += 1
+            except Exception as e:
+                failures["errors"] += 1
+                print(f"❌ Error importing {member.display_name}: {str(e)}")
+
+        processed += 1
+        if time.monotonic() - last_progress >= BULK_IMPORT_PROGRESS_INTERVAL:
+            last_progress = time.monotonic()
+            try:
+                await interaction.edit_original_response(
+                    content=f"⏳ Importing... {processed}/{len(rows)} processed, {len(granted)} granted")
+            except discord.HTTPException:
+                pass
 
-            return f"{hours}h {minutes}m {seconds}s"
+    await asyncio.gather(*(grant(*row) for row in rows))
 
-    except Exception as e:
-        print(f"Error calculating time for member {member_id}: {str(e)}")
-        return "ERROR"
+    # Members that got the role are tracked and persisted in a single commit;
+    # grants interrupted before this point are adopted by the startup reconciliation
+    for member_id, entry in granted.items():
+        config["active_members"][member_id] = entry
+        bot.track_member((guild_id, member_id))
+    await bot.persistence.flush()
+    return len(granted), failures
 
 
 @bot.tree.command(
@@ -705,19 +3318,21 @@ def get_remaining_time_display(member_id: str) -> str:
     description="Configure timed auto-role for new members (24h fixed duration)"
 )
 @app_commands.describe(
-    action="Enable/disable, check status, list active members, add user manually, or remove user",
+    action="Enable/disable, check status, list active members, add user manually, import users from CSV, or remove user",
     role="Role to assign to new members (required when enabling)",
     user="User to add/remove manually (required for adduser/removeuser actions)",
-    timing="Timing type for manual add: 24hours, weekend, or custom (required for adduser action)",
+    timing="Timing type for manual add: 24hours, weekend, or custom (required for adduser action, optional filter for list)",
     custom_hours="Custom hours for role duration (used with timing=custom)",
-    custom_minutes="Custom minutes for role duration (used with timing=custom)")
+    custom_minutes="Custom minutes for role duration (used with timing=custom)",
+    file="CSV of user_id,timing,custom_hours,custom_minutes rows (required for import action)")
 async def timed_auto_role_command(interaction: discord.Interaction,
                                   action: str,
                                   role: discord.Role | None = None,
                                   user: discord.Member | None = None,
                                   timing: str | None = None,
                                   custom_hours: int | None = None,
-                                  custom_minutes: int | None = None):
+                                  custom_minutes: int | None = None,
+                                  file: discord.Attachment | None = None):
     """Configure the timed auto-role system with fixed 24-hour duration"""
 
     # Check permissions
@@ -727,6 +3342,9 @@ async def timed_auto_role_command(interaction: discord.Interaction,
             ephemeral=True)
         return
 
+    config = get_auto_role_config(interaction.guild.id)
+    guild_id = interaction.guild.id
+
     try:
         if action.lower() == "enable":
             if not role:
@@ -743,12 +3361,15 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                 return
 
             # Update configuration (duration is fixed at 24 hours)
-            AUTO_ROLE_CONFIG["enabled"] = True
-            AUTO_ROLE_CONFIG["role_id"] = role.id
-            AUTO_ROLE_CONFIG["duration_hours"] = 24  # Fixed duration
+            config["enabled"] = True
+            config["role_id"] = role.id
+            config["duration_hours"] = 24  # Fixed duration
+
+            # Resume any members that came due while disabled
+            bot.release_held_expiries(guild_id)
 
             # Save configuration
-            await bot.save_auto_role_config()
+            bot.save_auto_role_config(guild_id)
 
             await interaction.response.send_message(
                 f"✅ **Auto-role system enabled!**\n"
@@ -759,30 +3380,36 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                 ephemeral=True)
 
         elif action.lower() == "disable":
-            AUTO_ROLE_CONFIG["enabled"] = False
-            await bot.save_auto_role_config()
+            config["enabled"] = False
+            bot.save_auto_role_config(guild_id)
 
             await interaction.response.send_message(
                 "✅ Auto-role system disabled. No new roles will be assigned to new members.",
                 ephemeral=True)
 
         elif action.lower() == "status":
-            if AUTO_ROLE_CONFIG["enabled"]:
+            if config["enabled"]:
                 role = interaction.guild.get_role(
-                    AUTO_ROLE_CONFIG["role_id"]
-                ) if interaction.guild and AUTO_ROLE_CONFIG["role_id"] else None
-                active_count = len(AUTO_ROLE_CONFIG["active_members"])
+                    config["role_id"]
+                ) if interaction.guild and config["role_id"] else None
+                active_count = len(config["active_members"])
                 weekend_pending_count = len(
-                    AUTO_ROLE_CONFIG.get("weekend_pending", {}))
+                    config.get("weekend_pending", {}))
+                outbox_size = await asyncio.to_thread(
+                    bot.state_store.dm_outbox_size)
 
                 status_message = f"✅ **Auto-role system is ENABLED**\n"
                 if role:
                     status_message += f"• **Role:** {role.mention}\n"
                 else:
-                    status_message += f"• **Role:** Not found (ID: {AUTO_ROLE_CONFIG['role_id']})\n"
+                    status_message += f"• **Role:** Not found (ID: {config['role_id']})\n"
                 status_message += f"• **Duration:** 24 hours (fixed)\n"
                 status_message += f"• **Active members:** {active_count}\n"
                 status_message += f"• **Weekend pending:** {weekend_pending_count}\n"
+                status_message += f"• **Join queue:** {bot.join_pipeline.depth} pending, {bot.join_pipeline.drain_rate():.0f}/min\n"
+                status_message += f"• **DM outbox:** {outbox_size} queued, {bot.dm_outbox.dead_lettered} dead-lettered\n"
+                if bot.expiry_executor.backlog:
+                    status_message += f"• **Expiry backlog:** {bot.expiry_executor.backlog} (drained by {bot.expiry_executor.planned_drain_time().strftime('%H:%M:%S')})\n"
                 status_message += f"• **Weekend handling:** Enabled"
             else:
                 status_message = "❌ **Auto-role system is DISABLED**"
@@ -791,70 +3418,33 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                                                     ephemeral=True)
 
         elif action.lower() == "list":
-            if not AUTO_ROLE_CONFIG["enabled"]:
+            if not config["enabled"]:
                 await interaction.response.send_message(
                     "❌ Auto-role system is disabled. No active members to display.",
                     ephemeral=True)
                 return
 
-            if not AUTO_ROLE_CONFIG["active_members"]:
+            if not config["active_members"]:
                 await interaction.response.send_message(
                     "📝 No members currently have temporary roles.",
                     ephemeral=True)
                 return
 
-            # Build the list of active members with precise time remaining
-            member_list = []
-
-            for member_id, data in AUTO_ROLE_CONFIG["active_members"].items():
-                try:
-                    # Get member info
-                    guild = interaction.guild
-                    if not guild:
-                        continue
-
-                    member = guild.get_member(int(member_id))
-                    if not member:
-                        continue
-
-                    # Get precise remaining time
-                    time_display = get_remaining_time_display(member_id)
-                    # Only add members who aren't expired (time_display will be None for expired)
-                    if time_display is not None:
-                        member_list.append(
-                            f"• {member.display_name} - {time_display}")
-
-                except Exception as e:
-                    print(f"Error processing member {member_id}: {str(e)}")
-                    continue
-
-            if not member_list:
+            if timing and timing.lower() not in AUTO_ROLE_LIST_KINDS:
                 await interaction.response.send_message(
-                    "📝 No valid members found with temporary roles.",
+                    "❌ Invalid filter. Use 'weekend', 'custom', or '24hours'.",
                     ephemeral=True)
                 return
 
-            # Create the response message
-            role = interaction.guild.get_role(
-                AUTO_ROLE_CONFIG["role_id"]
-            ) if interaction.guild and AUTO_ROLE_CONFIG["role_id"] else None
-            role_name = role.name if role else "Unknown Role"
-
-            list_message = f"📋 **Active Temporary Role Members**\n"
-            list_message += f"**Role:** {role_name}\n"
-            list_message += f"**Duration:** 24 hours (fixed)\n\n"
-            list_message += "\n".join(
-                member_list[:20]
-            )  # Limit to 20 members to avoid message length issues
-
-            if len(member_list) > 20:
-                list_message += f"\n\n*...and {len(member_list) - 20} more members*"
-
-            await interaction.response.send_message(list_message,
+            # Pages are served from the sorted expiry index
+            view = AutoRoleListView(interaction.guild,
+                                    timing.lower() if timing else None)
+            await interaction.response.send_message(view.render(),
+                                                    view=view,
                                                     ephemeral=True)
 
         elif action.lower() == "adduser":
-            if not AUTO_ROLE_CONFIG["enabled"]:
+            if not config["enabled"]:
                 await interaction.response.send_message(
                     "❌ Auto-role system is disabled. Enable it first before adding users manually.",
                     ephemeral=True)
@@ -890,7 +3480,7 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                     return
 
             # Get the configured role
-            target_role = interaction.guild.get_role(AUTO_ROLE_CONFIG["role_id"]) if interaction.guild else None
+            target_role = interaction.guild.get_role(config["role_id"]) if interaction.guild else None
             if not target_role:
                 await interaction.response.send_message(
                     "❌ Auto-role is not properly configured. No valid role found.",
@@ -898,7 +3488,7 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                 return
 
             # Check if user already has the role or is already tracked
-            if str(user.id) in AUTO_ROLE_CONFIG["active_members"]:
+            if str(user.id) in config["active_members"]:
                 await interaction.response.send_message(
                     f"❌ {user.display_name} already has an active temporary role.",
                     ephemeral=True)
@@ -917,16 +3507,9 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                 now = datetime.now(AMSTERDAM_TZ)
                 
                 if timing.lower() == "weekend":
-                    # Weekend timing - expires Monday 23:59
-                    expiry_time = bot.get_monday_expiry_time(now)
-                    
-                    AUTO_ROLE_CONFIG["active_members"][str(user.id)] = {
-                        "role_added_time": now.isoformat(),
-                        "role_id": target_role.id,
-                        "guild_id": interaction.guild.id,
-                        "weekend_delayed": True,
-                        "expiry_time": expiry_time.isoformat()
-                    }
+                    config["active_members"][str(
+                        user.id)] = bot.new_manual_tracking_entry(
+                            guild_id, target_role.id, "weekend", now)
                     
                     timing_info = f"Weekend timing (expires Monday 23:59)"
                     
@@ -942,16 +3525,11 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                             ephemeral=True)
                         return
                     
-                    expiry_time = now + timedelta(hours=hours, minutes=minutes)
-                    
-                    AUTO_ROLE_CONFIG["active_members"][str(user.id)] = {
-                        "role_added_time": now.isoformat(),
-                        "role_id": target_role.id,
-                        "guild_id": interaction.guild.id,
-                        "weekend_delayed": True,  # Use weekend logic for custom timing
-                        "expiry_time": expiry_time.isoformat(),
-                        "custom_duration": True
-                    }
+                    entry = bot.new_manual_tracking_entry(
+                        guild_id, target_role.id, "custom", now, hours,
+                        minutes)
+                    config["active_members"][str(user.id)] = entry
+                    expiry_time = entry.expiry_time()
                     
                     duration_text = []
                     if hours > 0:
@@ -963,17 +3541,14 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                     
                 else:
                     # 24-hour timing
-                    AUTO_ROLE_CONFIG["active_members"][str(user.id)] = {
-                        "role_added_time": now.isoformat(),
-                        "role_id": target_role.id,
-                        "guild_id": interaction.guild.id,
-                        "weekend_delayed": False
-                    }
+                    entry = bot.new_manual_tracking_entry(
+                        guild_id, target_role.id, "24hours", now)
+                    config["active_members"][str(user.id)] = entry
                     
-                    timing_info = f"24 hours (expires {(now + timedelta(hours=24)).strftime('%A %H:%M')})"
+                    timing_info = f"24 hours (expires {entry.expiry_time().strftime('%A %H:%M')})"
 
-                # Save configuration
-                await bot.save_auto_role_config()
+                # Schedule the new deadline and queue the member row for saving
+                bot.track_member((guild_id, str(user.id)))
 
                 await interaction.response.send_message(
                     f"✅ **Successfully added {user.display_name} to temporary role**\n"
@@ -991,6 +3566,73 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                     f"❌ Error adding role to {user.display_name}: {str(e)}",
                     ephemeral=True)
 
+        elif action.lower() == "import":
+            if not config["enabled"]:
+                await interaction.response.send_message(
+                    "❌ Auto-role system is disabled. Enable it first before importing users.",
+                    ephemeral=True)
+                return
+
+            if not file:
+                await interaction.response.send_message(
+                    "❌ You must attach a CSV file when using the import action.",
+                    ephemeral=True)
+                return
+
+            if file.size > BULK_IMPORT_MAX_BYTES:
+                await interaction.response.send_message(
+                    f"❌ The CSV file is too large (max {BULK_IMPORT_MAX_BYTES // 1024} KB).",
+                    ephemeral=True)
+                return
+
+            target_role = interaction.guild.get_role(config["role_id"])
+            if not target_role:
+                await interaction.response.send_message(
+                    "❌ Auto-role is not properly configured. No valid role found.",
+                    ephemeral=True)
+                return
+
+            await interaction.response.defer(ephemeral=True, thinking=True)
+
+            try:
+                text = (await file.read()).decode("utf-8-sig")
+            except UnicodeDecodeError:
+                await interaction.edit_original_response(
+                    content="❌ The CSV file must be UTF-8 text.")
+                return
+
+            # Validate every row before granting anything
+            rows, skipped, errors = parse_auto_role_import(
+                text, interaction.guild, config, target_role)
+            if errors:
+                error_message = "❌ **Import aborted, fix these rows first:**\n"
+                error_message += "\n".join(f"• {error}" for error in errors[:10])
+                if len(errors) > 10:
+                    error_message += f"\n*...and {len(errors) - 10} more*"
+                await interaction.edit_original_response(content=error_message)
+                return
+
+            if not rows:
+                await interaction.edit_original_response(
+                    content=f"📝 Nothing to import ({skipped} already tracked or holding the role).")
+                return
+
+            await interaction.edit_original_response(
+                content=f"⏳ Importing {len(rows)} member(s)...")
+            granted, failures = await run_auto_role_import(
+                interaction, config, target_role, rows)
+
+            summary = f"✅ **Import finished**\n"
+            summary += f"• **Role:** {target_role.name}\n"
+            summary += f"• **Granted:** {granted}\n"
+            summary += f"• **Skipped:** {skipped} (already tracked or holding the role)\n"
+            for reason, count in failures.items():
+                summary += f"• **Failed ({reason}):** {count}\n"
+            summary += f"• **Imported by:** {interaction.user.display_name}"
+            print(f"✅ Bulk import by {interaction.user.display_name}: {granted} granted, "
+                  f"{skipped} skipped, {sum(failures.values())} failed")
+            await interaction.edit_original_response(content=summary)
+
         elif action.lower() == "removeuser":
             if not user:
                 await interaction.response.send_message(
@@ -999,7 +3641,7 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                 return
 
             # Check if user is tracked in the system
-            if str(user.id) not in AUTO_ROLE_CONFIG["active_members"]:
+            if str(user.id) not in config["active_members"]:
                 await interaction.response.send_message(
                     f"❌ {user.display_name} is not currently tracked in the auto-role system.",
                     ephemeral=True)
@@ -1007,12 +3649,12 @@ async def timed_auto_role_command(interaction: discord.Interaction,
 
             try:
                 # Get the role info before removing
-                user_data = AUTO_ROLE_CONFIG["active_members"][str(user.id)]
-                role_id = user_data.get("role_id")
+                user_data = config["active_members"][str(user.id)]
+                role_id = user_data.role_id
                 target_role = interaction.guild.get_role(role_id) if interaction.guild and role_id else None
                 
                 # Remove from tracking
-                del AUTO_ROLE_CONFIG["active_members"][str(user.id)]
+                bot.untrack_member((guild_id, str(user.id)))
                 
                 # Remove the role if they still have it
                 if target_role and target_role in user.roles:
@@ -1021,9 +3663,6 @@ async def timed_auto_role_command(interaction: discord.Interaction,
                 else:
                     role_removed_msg = "• **Role status:** Already removed or not found"
 
-                # Save configuration
-                await bot.save_auto_role_config()
-
                 await interaction.response.send_message(
                     f"✅ **Successfully removed {user.display_name} from auto-role system**\n"
                     f"{role_removed_msg}\n"
@@ -1032,8 +3671,7 @@ async def timed_auto_role_command(interaction: discord.Interaction,
 
             except discord.Forbidden:
                 # Still remove from tracking even if we can't remove the role
-                del AUTO_ROLE_CONFIG["active_members"][str(user.id)]
-                await bot.save_auto_role_config()
+                bot.untrack_member((guild_id, str(user.id)))
                 
                 await interaction.response.send_message(
                     f"⚠️ **Removed {user.display_name} from tracking** but couldn't remove role due to permissions.\n"
@@ -1046,17 +3684,21 @@ async def timed_auto_role_command(interaction: discord.Interaction,
 
         else:
             await interaction.response.send_message(
-                "❌ Invalid action. Use 'enable', 'disable', 'status', 'list', 'adduser', or 'removeuser'.",
+                "❌ Invalid action. Use 'enable', 'disable', 'status', 'list', 'adduser', 'import', or 'removeuser'.",
                 ephemeral=True)
 
     except Exception as e:
-        await interaction.response.send_message(
-            f"❌ Error configuring auto-role: {str(e)}", ephemeral=True)
+        if interaction.response.is_done():
+            await interaction.followup.send(
+                f"❌ Error configuring auto-role: {str(e)}", ephemeral=True)
+        else:
+            await interaction.response.send_message(
+                f"❌ Error configuring auto-role: {str(e)}", ephemeral=True)
 
 
 @timed_auto_role_command.autocomplete('action')
 async def action_autocomplete(interaction: discord.Interaction, current: str):
-    actions = ['enable', 'disable', 'status', 'list', 'adduser', 'removeuser']
+    actions = ['enable', 'disable', 'status', 'list', 'adduser', 'import', 'removeuser']
     return [
         app_commands.Choice(name=action, value=action) for action in actions
         if current.lower() in action.lower()
@@ -1071,6 +3713,56 @@ async def timing_autocomplete(interaction: discord.Interaction, current: str):
     ]
 
 
+def resolve_broadcast_channels(guild, channels):
+    """Resolve comma-separated channel mentions, IDs or names to text channels
+
+    Returns the unique channels found and the identifiers that did not match.
+    """
+    resolved, unresolved = [], []
+    for channel_identifier in (ch.strip() for ch in channels.split(',')):
+        if not channel_identifier:
+            continue
+        target_channel = bot.resolver.channel(guild, channel_identifier)
+        if target_channel:
+            if target_channel not in resolved:
+                resolved.append(target_channel)
+        else:
+            unresolved.append(channel_identifier)
+    return resolved, unresolved
+
+
+async def broadcast_to_channels(interaction, channels, content, label):
+    """Fan content out to the requested channels and report in one followup
+
+    The interaction must already be deferred. Returns the broadcast results.
+    """
+    target_channels, unresolved = resolve_broadcast_channels(
+        interaction.guild, channels)
+    # Unwritable channels are rejected from the cached permissions, not a failed send
+    writable = [
+        channel for channel in target_channels if bot.resolver.can_send(channel)
+    ]
+    results = await bot.broadcaster.broadcast(writable, content)
+
+    sent = [result for result in results if result[2] is None]
+    lines = [f"• #{channel.name} - {latency:.0f} ms"
+             for channel, message, error, latency in sent]
+    for channel, message, error, latency in results:
+        if error is not None:
+            lines.append(f"• ❌ #{channel.name} - {error}")
+            bot.resolver.invalidate_permissions(channel.guild.id, channel.id)
+    lines += [f"• ❌ #{channel.name} - no permission"
+              for channel in target_channels if channel not in writable]
+    lines += [f"• ❌ {name} - channel not found" for name in unresolved]
+
+    if sent:
+        report = f"✅ {label} sent to {len(sent)}/{len(target_channels) + len(unresolved)} channel(s):\n"
+    else:
+        report = "❌ No valid channels found or no messages sent.\n"
+    await interaction.followup.send(report + "\n".join(lines), ephemeral=True)
+    return results
+
+
 @bot.tree.command(name="entry", description="Create a trading signal entry")
 @app_commands.describe(
     entry_type="Type of entry (Long, Short, Long Swing, Short Swing)",
@@ -1083,9 +3775,15 @@ async def entry_command(interaction: discord.Interaction, entry_type: str,
                         pair: str, price: float, channels: str, roles: str):
     """Create and send a trading signal to specified channels"""
 
+    # Acknowledge right away, the fan-out can take longer than 3 seconds
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
     try:
         # Calculate TP and SL levels
         levels = calculate_levels(price, pair, entry_type)
+        take_profit_lines = "\n".join(
+            f"TP{number}: {tp}"
+            for number, tp in enumerate(levels['tps'], start=1))
 
         # Create the signal message
         signal_message = f"""**Trade Signal For: {pair}**
@@ -1093,9 +3791,7 @@ Entry Type: {entry_type}
 Entry Price: {levels['entry']}
 
 **Take Profit Levels:**
-TP1: {levels['tp1']}
-TP2: {levels['tp2']}
-TP3: {levels['tp3']}
+{take_profit_lines}
 
 Stop Loss: {levels['sl']}"""
 
@@ -1109,10 +3805,8 @@ Stop Loss: {levels['sl']}"""
                 ) == "everyone":
                     role_mentions.append("@everyone")
                 else:
-                    # Find role by name in the guild
-                    role = discord.utils.get(
-                        interaction.guild.roles,
-                        name=role_name) if interaction.guild else None
+                    # Find role by name, mention or ID in the guild
+                    role = bot.resolver.role(interaction.guild, role_name)
                     if role:
                         role_mentions.append(role.mention)
                     else:
@@ -1125,52 +3819,24 @@ Stop Loss: {levels['sl']}"""
         if pair.upper() in ['US100', 'GER40']:
             signal_message += f"\n\n**Please note that prices on US100 & GER40 vary a lot from broker to broker, so it is possible that the current price in our signal is different than the current price with your broker. Execute this signal within a 5 minute window of this trade being sent and please manually recalculate the pip value for TP1/2/3 & SL depending on your broker's current price.**"
 
-        # Parse and send to multiple channels
-        channel_list = [ch.strip() for ch in channels.split(',')]
-        sent_channels = []
-
-        for channel_identifier in channel_list:
-            target_channel = None
-
-            # Try to parse as channel mention
-            if channel_identifier.startswith(
-                    '<#') and channel_identifier.endswith('>'):
-                channel_id = int(channel_identifier[2:-1])
-                target_channel = bot.get_channel(channel_id)
-            # Try to parse as channel ID
-            elif channel_identifier.isdigit():
-                target_channel = bot.get_channel(int(channel_identifier))
-            # Try to find by name
-            else:
-                target_channel = discord.utils.get(
-                    interaction.guild.channels,
-                    name=channel_identifier) if interaction.guild else None
+        # Send to all channels at once and report per channel
+        results = await broadcast_to_channels(interaction, channels,
+                                              signal_message, "Signal")
 
-            if target_channel and isinstance(target_channel,
-                                             discord.TextChannel):
-                try:
-                    await target_channel.send(signal_message)
-                    sent_channels.append(target_channel.name)
-                except discord.Forbidden:
-                    await interaction.followup.send(
-                        f"❌ No permission to send to #{target_channel.name}",
-                        ephemeral=True)
-                except Exception as e:
-                    await interaction.followup.send(
-                        f"❌ Error sending to #{target_channel.name}: {str(e)}",
-                        ephemeral=True)
-
-        if sent_channels:
-            await interaction.response.send_message(
-                f"✅ Signal sent to: {', '.join(sent_channels)}",
-                ephemeral=True)
-        else:
-            await interaction.response.send_message(
-                "❌ No valid channels found or no messages sent.",
-                ephemeral=True)
+        # Record the signal in the ledger (written in the background)
+        messages = {
+            channel.id: message.id
+            for channel, message, error, latency in results if message
+        }
+        if messages:
+            bot.signal_recorder.record(
+                interaction.guild.id if interaction.guild else None,
+                interaction.user.id, pair, entry_type,
+                LEVEL_ENGINE.levels(price, pair, entry_type), messages,
+                signal_message)
 
     except Exception as e:
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"❌ Error creating signal: {str(e)}", ephemeral=True)
 
 
@@ -1223,31 +3889,119 @@ async def pair_autocomplete(interaction: discord.Interaction, current: str):
     ]
 
 
+def parse_stats_date_range(date_range: str, today: date):
+    """Turn a /stats date range into inclusive (start, end) dates, or None
+
+    Accepts today, yesterday, this week, last week, this month, last month,
+    last N days, YYYY-MM-DD, and YYYY-MM-DD to YYYY-MM-DD (or "-" / "..").
+    """
+    text = date_range.strip().lower()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    if text == "today":
+        return today, today
+    if text == "yesterday":
+        return today - timedelta(days=1), today - timedelta(days=1)
+    if text in ("week", "this week"):
+        return week_start, today
+    if text == "last week":
+        return week_start - timedelta(days=7), week_start - timedelta(days=1)
+    if text in ("month", "this month"):
+        return month_start, today
+    if text == "last month":
+        last_month_end = month_start - timedelta(days=1)
+        return last_month_end.replace(day=1), last_month_end
+    if text.startswith("last ") and text.endswith(" days"):
+        days = text[5:-5].strip()
+        if days.isdigit() and int(days) > 0:
+            return today - timedelta(days=int(days) - 1), today
+
+    for separator in (" to ", "..", " - "):
+        if separator in text:
+            start, end = (part.strip() for part in text.split(separator, 1))
+            break
+    else:
+        start = end = text
+    try:
+        start, end = date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError:
+        return None
+    return (start, end) if start <= end else None
+
+
 @bot.tree.command(name="stats", description="Send trading statistics summary")
 @app_commands.describe(
-    date_range="Date range for the statistics",
-    total_signals="Total number of signals sent",
+    date_range=
+    "Date range for the statistics (e.g. 'last week' or '2026-09-01 to 2026-09-30' when computed from the ledger)",
+    channels=
+    "Select channels to send the stats to (comma-separated channel mentions or names)",
+    total_signals="Total number of signals sent (leave the counts empty to compute them from recorded signals)",
     tp1_hits="Number of TP1 hits",
     tp2_hits="Number of TP2 hits",
     tp3_hits="Number of TP3 hits",
     sl_hits="Number of SL hits",
-    channels=
-    "Select channels to send the stats to (comma-separated channel mentions or names)",
     currently_open="Number of currently open trades",
-    total_closed="Total closed trades (auto-calculated if not provided)")
+    total_closed="Total closed trades (auto-calculated if not provided)",
+    pair="Only count this pair (computed stats only)")
 async def stats_command(interaction: discord.Interaction,
                         date_range: str,
-                        total_signals: int,
-                        tp1_hits: int,
-                        tp2_hits: int,
-                        tp3_hits: int,
-                        sl_hits: int,
                         channels: str,
-                        currently_open: str = "0",
-                        total_closed: int = None):
+                        total_signals: int = None,
+                        tp1_hits: int = None,
+                        tp2_hits: int = None,
+                        tp3_hits: int = None,
+                        sl_hits: int = None,
+                        currently_open: str = None,
+                        total_closed: int = None,
+                        pair: str = None):
     """Send formatted trading statistics to specified channels"""
 
+    # Acknowledge right away, the fan-out can take longer than 3 seconds
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
     try:
+        manual_counts = (total_signals, tp1_hits, tp2_hits, tp3_hits, sl_hits)
+        extra_lines = ""
+        if all(count is None for count in manual_counts):
+            # Compute the numbers by summing the ledger's day buckets
+            period = parse_stats_date_range(
+                date_range, datetime.now(AMSTERDAM_TZ).date())
+            if period is None:
+                await interaction.followup.send(
+                    "❌ Unrecognized date range. Use e.g. 'last week', 'this month', 'last 30 days' or '2026-09-01 to 2026-09-30'.",
+                    ephemeral=True)
+                return
+            await bot.signal_recorder.flush()
+            stats = await asyncio.to_thread(bot.signal_ledger.aggregate,
+                                            *period, pair)
+            tp_hits = stats['tp_hits'] + [0] * (3 - len(stats['tp_hits']))
+            total_signals = stats['signals']
+            tp1_hits, tp2_hits, tp3_hits = tp_hits[:3]
+            sl_hits = stats['sl']
+            if total_closed is None:
+                total_closed = stats['closed']
+            if currently_open is None:
+                currently_open = str(stats['open'])
+            for number, hits in enumerate(tp_hits[3:], start=4):
+                extra_lines += f"\n• TP{number} Hits: **{hits}**"
+            extra_lines += f"\n• Closed at Breakeven: **{stats['breakeven']}**"
+            extra_lines += f"\n• Pips Gained: **{stats['pips']:+.1f}**"
+            if pair:
+                date_range = f"{date_range} ({pair.upper()})"
+        elif any(count is None for count in manual_counts):
+            await interaction.followup.send(
+                "❌ Provide total_signals and all TP/SL hit counts, or leave them all empty to compute them.",
+                ephemeral=True)
+            return
+        elif pair:
+            await interaction.followup.send(
+                "❌ The pair filter only applies to computed stats. Leave the counts empty or drop the pair.",
+                ephemeral=True)
+            return
+
+        if currently_open is None:
+            currently_open = "0"
+
         # Calculate total closed if not provided
         if total_closed is None:
             total_closed = tp1_hits + sl_hits
@@ -1280,7 +4034,7 @@ async def stats_command(interaction: discord.Interaction,
 **:dart: TAKE PROFIT PERFORMANCE**
 • TP1 Hits: **{tp1_hits}**
 • TP2 Hits: **{tp2_hits}**
-• TP3 Hits: **{tp3_hits}**
+• TP3 Hits: **{tp3_hits}**{extra_lines}
 
 **:octagonal_sign: STOP LOSS**
 • SL Hits: **{sl_hits}** ({sl_percent})
@@ -1289,52 +4043,829 @@ async def stats_command(interaction: discord.Interaction,
 • **Win Rate:** {tp1_percent}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"""
 
-        # Parse and send to multiple channels
-        channel_list = [ch.strip() for ch in channels.split(',')]
-        sent_channels = []
-
-        for channel_identifier in channel_list:
-            target_channel = None
-
-            # Try to parse as channel mention
-            if channel_identifier.startswith(
-                    '<#') and channel_identifier.endswith('>'):
-                channel_id = int(channel_identifier[2:-1])
-                target_channel = bot.get_channel(channel_id)
-            # Try to parse as channel ID
-            elif channel_identifier.isdigit():
-                target_channel = bot.get_channel(int(channel_identifier))
-            # Try to find by name
+        # Send to all channels at once and report per channel
+        await broadcast_to_channels(interaction, channels, stats_message,
+                                    "Stats")
+
+    except Exception as e:
+        await interaction.followup.send(
+            f"❌ Error sending stats: {str(e)}", ephemeral=True)
+
+
+signal_group = app_commands.Group(name="signal",
+                                  description="Manage posted trading signals")
+
+
+def compose_signal_update(content, updates, limit=2000):
+    """Signal message with its update log, dropping the oldest updates past Discord's limit"""
+    lines = []
+    for line in reversed(updates):
+        candidate = "\n".join([line] + lines)
+        if len(content) + len("\n\n**Updates:**\n") + len(candidate) > limit:
+            break
+        lines.insert(0, line)
+    if not lines:
+        return content[:limit]
+    return content + "\n\n**Updates:**\n" + "\n".join(lines)
+
+
+async def resolve_signal_reference(reference: str):
+    """Ledger signal for a signal number, message ID or message link, or None"""
+    number = reference.strip().rstrip("/").rsplit("/", 1)[-1].lstrip("#")
+    if not number.isdigit():
+        return None
+    number = int(number)
+    await bot.signal_recorder.flush()
+    if number >= 1 << 32:  # Snowflake, look up the signal that sent it
+        number = await asyncio.to_thread(bot.signal_ledger.signal_id_for_message,
+                                         number)
+        if number is None:
+            return None
+    return await asyncio.to_thread(bot.signal_ledger.signal, number)
+
+
+@signal_group.command(name="update",
+                      description="Edit or reply to every posted copy of a signal")
+@app_commands.describe(
+    signal="Signal number, or the ID or link of any of its messages",
+    update="Update text, e.g. 'TP1 hit' or 'SL moved to breakeven'",
+    mode="Edit the signal messages (default) or reply to them")
+async def signal_update_command(interaction: discord.Interaction, signal: str,
+                                update: str, mode: str = "edit"):
+    """Apply a trade management update to every channel a signal was sent to"""
+
+    # Acknowledge right away, the fan-out can take longer than 3 seconds
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    try:
+        if mode not in ("edit", "reply"):
+            await interaction.followup.send("❌ Mode must be 'edit' or 'reply'.",
+                                            ephemeral=True)
+            return
+        record = await resolve_signal_reference(signal)
+        if record is None or (interaction.guild and record['guild_id'] not in
+                              (None, interaction.guild.id)):
+            await interaction.followup.send(
+                "❌ Signal not found. Use the signal number or the ID/link of one of its messages.",
+                ephemeral=True)
+            return
+
+        targets, lines = [], []
+        for channel_id, message_id in record['messages'].items():
+            channel = bot.get_channel(channel_id)
+            if channel is None:
+                lines.append(f"• ❌ <#{channel_id}> - channel not found")
             else:
-                target_channel = discord.utils.get(
-                    interaction.guild.channels,
-                    name=channel_identifier) if interaction.guild else None
+                targets.append((channel, message_id))
+        if not targets:
+            await interaction.followup.send(
+                "❌ None of this signal's channels are reachable.\n" + "\n".join(lines),
+                ephemeral=True)
+            return
 
-            if target_channel and isinstance(target_channel,
-                                             discord.TextChannel):
-                try:
-                    await target_channel.send(stats_message)
-                    sent_channels.append(target_channel.name)
-                except discord.Forbidden:
-                    await interaction.followup.send(
-                        f"❌ No permission to send to #{target_channel.name}",
-                        ephemeral=True)
-                except Exception as e:
-                    await interaction.followup.send(
-                        f"❌ Error sending to #{target_channel.name}: {str(e)}",
-                        ephemeral=True)
+        stamp = datetime.now(AMSTERDAM_TZ).strftime("%d-%m %H:%M")
+        await asyncio.to_thread(bot.signal_ledger.add_signal_update,
+                                record['id'], f"• {stamp} - {update}")
+        if mode == "edit":
 
-        if sent_channels:
-            await interaction.response.send_message(
-                f"✅ Stats sent to: {', '.join(sent_channels)}", ephemeral=True)
+            async def render():
+                # Read at edit time so coalesced edits carry every update so far
+                return compose_signal_update(*await asyncio.to_thread(
+                    bot.signal_ledger.signal_text, record['id']))
+
+            results = await bot.broadcaster.edit_messages(targets, render)
         else:
-            await interaction.response.send_message(
-                "❌ No valid channels found or no messages sent.",
-                ephemeral=True)
+            results = await bot.broadcaster.reply_to_messages(
+                targets, f"**{record['pair']} {record['entry_type']} update:** {update}")
+
+        done = 0
+        for channel, error, latency in results:
+            if error is None:
+                done += 1
+                lines.append(f"• #{channel.name} ({latency:.0f} ms)")
+            else:
+                lines.append(f"• ❌ #{channel.name} - {error}")
+        action = "edited" if mode == "edit" else "replied to"
+        if done:
+            report = f"✅ Signal #{record['id']} {action} in {done}/{len(record['messages'])} channel(s):\n"
+        else:
+            report = f"❌ Signal #{record['id']} could not be {action} anywhere.\n"
+        await interaction.followup.send(report + "\n".join(lines), ephemeral=True)
 
     except Exception as e:
-        await interaction.response.send_message(
-            f"❌ Error sending stats: {str(e)}", ephemeral=True)
+        await interaction.followup.send(
+            f"❌ Error updating signal: {str(e)}", ephemeral=True)
+
+
+@signal_update_command.autocomplete('signal')
+async def signal_autocomplete(interaction: discord.Interaction, current: str):
+    signals = await asyncio.to_thread(
+        bot.signal_ledger.recent_signals,
+        interaction.guild.id if interaction.guild else None)
+    choices = []
+    for record in signals:
+        name = (f"#{record['id']} {record['pair']} {record['entry_type']} @ {record['entry']} "
+                f"({datetime.fromtimestamp(record['created_ts'], AMSTERDAM_TZ):%d-%m %H:%M})")
+        if current.lower() in name.lower():
+            choices.append(app_commands.Choice(name=name, value=str(record['id'])))
+    return choices[:25]
+
+
+@signal_update_command.autocomplete('mode')
+async def signal_mode_autocomplete(interaction: discord.Interaction,
+                                   current: str):
+    return [
+        app_commands.Choice(name=mode, value=mode) for mode in ("edit", "reply")
+        if current.lower() in mode
+    ]
+
+
+bot.tree.add_command(signal_group)
+
+
+# Backtesting: python main.py backtest <prices> --pair <PAIR> ...
+def price_columns(block):
+    """Split a price block into (ts, high, low, close) columns
+
+    Rows are ts,price ticks, ts,high,low,close bars or ts,open,high,low,close
+    bars (a trailing volume column is ignored). ts is in epoch seconds.
+    """
+    columns = block.shape[1]
+    if columns == 2:
+        return block[:, 0], block[:, 1], block[:, 1], block[:, 1]
+    if columns == 4:
+        return block[:, 0], block[:, 1], block[:, 2], block[:, 3]
+    if columns in (5, 6):
+        return block[:, 0], block[:, 2], block[:, 3], block[:, 4]
+    raise ValueError(f"Expected 2, 4, 5 or 6 price columns, got {columns}")
+
+
+def iter_price_chunks(path, chunk_rows=BACKTEST_CHUNK_ROWS):
+    """Yield (ts, high, low, close) chunks of a memory-mapped .npy or CSV price file
+
+    Only the chunk being replayed is paged in, so histories larger than RAM
+    work. CSV files may start with a header line.
+    """
+    if path.endswith(".npy"):
+        data = np.load(path, mmap_mode="r")
+        if data.ndim != 2:
+            raise ValueError(f"{path} must hold a 2-D price array")
+        for start in range(0, len(data), chunk_rows):
+            yield price_columns(np.asarray(data[start:start + chunk_rows], dtype=float))
+        return
+
+    if os.path.getsize(path) == 0:
+        return  # An empty file cannot be memory-mapped and has no rows anyway
+    chunk_bytes = chunk_rows * 48  # Rough bytes per CSV row
+    with open(path, "rb") as price_file, mmap.mmap(
+            price_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = 0
+        first_line = mapped[:mapped.find(b"\n") + 1 or len(mapped)]
+        if not first_line[:1].isdigit():
+            position = len(first_line)  # Header
+        while position < len(mapped):
+            end = mapped.find(b"\n", min(position + chunk_bytes, len(mapped) - 1))
+            end = len(mapped) if end == -1 else end + 1
+            block = np.loadtxt(io.BytesIO(mapped[position:end]), delimiter=",",
+                               ndmin=2)
+            position = end
+            if len(block):
+                yield price_columns(block)
+
+
+def parse_backtest_time(value):
+    """Epoch seconds from a number or an ISO date/time (naive means Amsterdam time)"""
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is None:
+            moment = localize_amsterdam(moment)
+        return moment.timestamp()
+
+
+class BacktestBook:
+    """Signals of one pair under replay: levels as arrays plus per-signal hit state
+
+    Signals must be added in creation order. Hits follow the ledger rules: TPs
+    only move forward, the stop moves from the SL to the entry once TP1 is hit,
+    and a signal closes on its stop or last TP. Ties go against the signal:
+    when one bar touches both the stop and a TP the stop counts, and the
+    breakeven stop applies from the bar after TP1.
+    """
+
+    MAX_SEGMENT = 1 << 16  # Bars per replay segment, bounds the breakeven search table
+
+    def __init__(self, pair):
+        self.pair = pair.upper()
+        self.pip_value = PAIR_CONFIG[self.pair]['pip_value']
+        self.size = 0
+        self.max_tps = 0
+        self.created = self.entry = self.sl = self.sl_ts = self.breakeven_ts = np.zeros(0)
+        self.is_buy = self.closed = np.zeros(0, bool)
+        self.best_tp = self.tp_count = self.group = np.zeros(0, np.int64)
+        self.tps = self.tp_ts = np.zeros((0, 0))
+        self.entry_types = []
+        self._pending = []  # Added blocks not stacked yet
+        self._started = 0  # Signals that went live, in creation order
+        self._live = np.zeros(0, np.int64)  # Started and not closed
+
+    def add(self, created_ts, entry_type, levels, group=0):
+        """Add signals sharing an entry type; levels are LevelEngine.levels_batch() arrays
+
+        group tags the signals (e.g. with a candidate ladder) for aggregate_groups().
+        """
+        entries = np.asarray(levels['entry'], dtype=float)
+        if len(entries):
+            self._pending.append((np.broadcast_to(np.asarray(
+                created_ts, dtype=float), entries.shape), entry_type, entries,
+                np.atleast_2d(np.asarray(levels['tps'], dtype=float)),
+                np.asarray(levels['sl'], dtype=float), group))
+
+    def _stack(self):
+        """Append the pending blocks to the signal arrays and hit state"""
+        if not self._pending:
+            return
+        blocks, self._pending = self._pending, []
+        added = sum(len(block[2]) for block in blocks)
+        width = max([self.max_tps] + [block[3].shape[1] for block in blocks])
+
+        def widen(array, rows):
+            wide = np.full((rows, width), np.nan)
+            wide[:len(array), :array.shape[1]] = array
+            return wide
+
+        # New rows are kept in creation order, replay relies on it
+        created = np.concatenate([block[0] for block in blocks])
+        order = np.argsort(created, kind="stable")
+        entry_types = [block[1] for block in blocks for _ in range(len(block[2]))]
+        self.created = np.concatenate([self.created, created[order]])
+        self.entry = np.concatenate(
+            [self.entry, np.concatenate([block[2] for block in blocks])[order]])
+        self.tps = np.concatenate([widen(self.tps, self.size), np.concatenate(
+            [widen(block[3], len(block[3])) for block in blocks])[order]])
+        self.sl = np.concatenate(
+            [self.sl, np.concatenate([block[4] for block in blocks])[order]])
+        self.is_buy = np.concatenate([self.is_buy, np.concatenate(
+            [np.full(len(block[2]), parse_entry_type(block[1])[0])
+             for block in blocks])[order]])
+        self.entry_types.extend(entry_types[index] for index in order)
+        self.group = np.concatenate([self.group, np.concatenate(
+            [np.full(len(block[2]), block[5], np.int64) for block in blocks])[order]])
+        self.tp_ts = widen(self.tp_ts, self.size + added)
+        self.max_tps = width
+        self.best_tp = np.concatenate([self.best_tp, np.zeros(added, np.int64)])
+        self.sl_ts = np.concatenate([self.sl_ts, np.full(added, np.nan)])
+        self.breakeven_ts = np.concatenate([self.breakeven_ts, np.full(added, np.nan)])
+        self.closed = np.concatenate([self.closed, np.zeros(added, bool)])
+        self.tp_count = (~np.isnan(self.tps)).sum(axis=1)
+        self.size += added
+
+    def replay(self, ts, high, low):
+        """Apply one chunk of prices to every signal created before its end
+
+        The chunk is split at the bars where signals start. Within a segment all
+        live signals share the running high/low from its first bar, so the first
+        crossing of every level is a binary search on those monotonic arrays.
+        """
+        self._stack()
+        if not self.size:
+            return
+        first_new = self._started
+        last_new = int(np.searchsorted(self.created, ts[-1], side="right"))
+        starts = np.searchsorted(ts, self.created[first_new:last_new], side="left")
+        bounds = np.unique(np.concatenate(
+            [np.arange(0, len(ts), self.MAX_SEGMENT), starts, [len(ts)]]))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            # Signals that start on this segment's first bar go live here
+            joined = first_new + np.searchsorted(starts, a, side="right")
+            if joined > self._started:
+                self._live = np.concatenate(
+                    [self._live, np.arange(self._started, joined)])
+                self._started = joined
+            if len(self._live):
+                self._replay_segment(ts, high, low, a, b)
+        self._started = last_new
+
+    def _replay_segment(self, ts, high, low, a, b):
+        # Only signals whose next TP or stop lies within the segment's range can
+        # change, which skips most long-running signals without a search
+        best = self.best_tp[self._live]
+        buy = self.is_buy[self._live]
+        next_tp = self.tps[self._live, np.minimum(best, self.max_tps - 1)]
+        stop = np.where(best == 0, self.sl[self._live], self.entry[self._live])
+        segment_high, segment_low = high[a:b].max(), low[a:b].min()
+        touched = np.flatnonzero(np.where(
+            buy, (next_tp <= segment_high) | (stop >= segment_low),
+            (next_tp >= segment_low) | (stop <= segment_high)))
+        if not len(touched):
+            return
+        live, buy, best, stop = (self._live[touched], buy[touched], best[touched],
+                                 stop[touched])
+
+        rising = np.maximum.accumulate(high[a:b])
+        falling = -np.minimum.accumulate(low[a:b])  # Nondecreasing as well
+        length = b - a
+        tps = self.tps[live]
+        tp_idx = np.empty(tps.shape, np.int64)
+        stop_idx = np.empty(len(live), np.int64)
+        tp_idx[buy] = np.searchsorted(rising, tps[buy])
+        tp_idx[~buy] = np.searchsorted(falling, -tps[~buy])
+        stop_idx[buy] = np.searchsorted(falling, -stop[buy])
+        stop_idx[~buy] = np.searchsorted(rising, stop[~buy])
+
+        # Before TP1 the stop is the SL; with TP1 already in it is the entry
+        sl_first = (best == 0) & (stop_idx < length) & (stop_idx <= tp_idx[:, 0])
+        breakeven_idx = np.where(best > 0, stop_idx, length)
+        # Signals reaching TP1 here move their stop to the entry from the next bar
+        first_tp = np.flatnonzero((best == 0) & ~sl_first & (tp_idx[:, 0] < length))
+        if len(first_tp):
+            breakeven_idx[first_tp] = self._breakeven_after(
+                high[a:b], low[a:b], tp_idx[first_tp, 0] + 1,
+                self.entry[live[first_tp]], buy[first_tp])
+
+        reached = (tp_idx < np.minimum(breakeven_idx, length)[:, None]) & ~sl_first[:, None]
+        hit = reached & (np.arange(self.max_tps) >= best[:, None])
+        rows, columns = np.nonzero(hit)
+        self.tp_ts[live[rows], columns] = ts[a + tp_idx[rows, columns]]
+        new_best = np.maximum(best, reached.sum(axis=1))
+        self.best_tp[live] = new_best
+        self.sl_ts[live[sl_first]] = ts[a + stop_idx[sl_first]]
+        all_tps = new_best == self.tp_count[live]
+        breakeven = ~all_tps & (breakeven_idx < length)
+        self.breakeven_ts[live[breakeven]] = ts[a + breakeven_idx[breakeven]]
+
+        closed = sl_first | all_tps | breakeven
+        self.closed[live[closed]] = True
+        still_live = np.ones(len(self._live), bool)
+        still_live[touched[closed]] = False
+        self._live = self._live[still_live]
+
+    @staticmethod
+    def _breakeven_after(high, low, starts, entries, buy):
+        """First bar at or after each start where price returns to the entry
+
+        Uses a sparse table of range minimums (lows for buys, negated highs for
+        sells): each query skips blocks of 2^k bars that stay clear of the entry,
+        largest first. Returns len(low) where the entry is never reached.
+        """
+        length = len(low)
+        result = np.full(len(starts), length, np.int64)
+        for side in (True, False):
+            queries = np.flatnonzero(buy == side)
+            if not len(queries):
+                continue
+            values = low if side else -high
+            levels = entries[queries] if side else -entries[queries]
+            tables = [values]
+            while (2 << (len(tables) - 1)) <= length:
+                half = 1 << (len(tables) - 1)
+                tables.append(np.minimum(tables[-1][:-half], tables[-1][half:]))
+            position = starts[queries].copy()
+            for power in range(len(tables) - 1, -1, -1):
+                step = 1 << power
+                fits = np.flatnonzero(position + step <= length)
+                clear = tables[power][position[fits]] > levels[fits]
+                position[fits[clear]] += step
+            result[queries] = position
+        return result
+
+    def pips(self):
+        """Pips per signal as the ledger counts them (open signals keep their TP progress)"""
+        self._stack()
+        rows = np.arange(self.size)
+        best_level = np.where(self.best_tp > 0,
+                              self.tps[rows, np.maximum(self.best_tp - 1, 0)],
+                              self.entry)
+        gained = np.abs(best_level - self.entry)
+        lost = -np.abs(self.entry - self.sl)
+        return np.where(~np.isnan(self.sl_ts), lost, gained) / self.pip_value
+
+    def aggregate(self, mask=None):
+        """Totals shaped like SignalLedger.aggregate(), optionally for a subset"""
+        self._stack()
+        mask = np.ones(self.size, bool) if mask is None else mask
+        best = self.best_tp[mask]
+        sl = int((~np.isnan(self.sl_ts[mask])).sum())
+        breakeven = int((~np.isnan(self.breakeven_ts[mask])).sum())
+        tp_hits = [int((best >= number).sum())
+                   for number in range(1, self.max_tps + 1)]
+        signals = int(mask.sum())
+        closed = (tp_hits[0] if tp_hits else 0) + sl
+        return {
+            'signals': signals,
+            'closed': closed,
+            'open': signals - closed,
+            'tp_hits': tp_hits,
+            'sl': sl,
+            'breakeven': breakeven,
+            'pips': float(self.pips()[mask].sum())
+        }
+
+    def aggregate_groups(self, groups):
+        """Per group over finished signals: (closed, TP1 hits, SL hits, breakevens, pips)
+
+        Signals still running after TP1 are left out so a ladder is scored on
+        outcomes the stop can no longer change.
+        """
+        self._stack()
+        closed = self.closed
+        sl_hit = ~np.isnan(self.sl_ts)
+        tp1_hit = closed & (self.best_tp > 0)
+        breakeven = ~np.isnan(self.breakeven_ts)
+        pips = np.where(closed, self.pips(), 0.0)
+
+        def count(values):
+            return np.bincount(self.group, weights=values, minlength=groups)
+
+        return count(closed), count(tp1_hit), count(sl_hit), count(breakeven), count(pips)
+
+    def write_outcomes(self, path):
+        """Write one CSV row per signal with its hit timestamps and pips"""
+        pips = self.pips()
+        with open(path, "w", newline="") as outcomes_file:
+            writer = csv.writer(outcomes_file)
+            writer.writerow(
+                ["created_ts", "pair", "entry_type", "entry", "sl", "tps", "best_tp",
+                 "sl_hit"] + [f"tp{number}_ts" for number in range(1, self.max_tps + 1)]
+                + ["sl_ts", "breakeven_ts", "pips"])
+            for row in range(self.size):
+                count = self.tp_count[row]
+                writer.writerow(
+                    [self.created[row], self.pair, self.entry_types[row],
+                     self.entry[row], self.sl[row],
+                     " ".join(str(tp) for tp in self.tps[row, :count]),
+                     self.best_tp[row], int(not np.isnan(self.sl_ts[row]))]
+                    + ["" if np.isnan(hit) else hit for hit in self.tp_ts[row]]
+                    + ["" if np.isnan(self.sl_ts[row]) else self.sl_ts[row],
+                       "" if np.isnan(self.breakeven_ts[row]) else self.breakeven_ts[row],
+                       round(float(pips[row]), 1)])
+
+
+def format_backtest_stats(label, stats):
+    """Plain-text version of the /stats overview for the terminal"""
+    closed = stats['closed']
+
+    def percentage(hits):
+        return f"{(hits / closed) * 100:.0f}%" if closed else "0%"
+
+    lines = [f"📊 {label}",
+             f"  Total Signals: {stats['signals']}",
+             f"  Total Closed: {closed}",
+             f"  Currently Open: {stats['open']}"]
+    lines += [f"  TP{number} Hits: {hits} ({percentage(hits)})"
+              for number, hits in enumerate(stats['tp_hits'], start=1)]
+    lines += [f"  SL Hits: {stats['sl']} ({percentage(stats['sl'])})",
+              f"  Closed at Breakeven: {stats['breakeven']}",
+              f"  Pips Gained: {stats['pips']:+.1f}",
+              f"  Win Rate: {percentage(stats['tp_hits'][0] if stats['tp_hits'] else 0)}"]
+    return "\n".join(lines)
+
+
+def load_backtest_signals(book, path=None, use_ledger=False):
+    """Add past signals for the book's pair from a CSV file or the signal ledger
+
+    The CSV needs created_ts, entry_type and entry columns (pair is optional);
+    its levels come from calculate_levels' ladders. Ledger signals keep the
+    levels they were sent with.
+    """
+    rows = []
+    if use_ledger:
+        ledger = SignalLedger(SIGNAL_LEDGER_DB_PATH)
+        ledger.open()
+        try:
+            for signal_row in ledger.signals_between(0, float("inf"), book.pair):
+                rows.append((signal_row['created_ts'], signal_row['entry_type'], {
+                    'entry': [signal_row['entry']],
+                    'tps': [signal_row['tps']],
+                    'sl': [signal_row['sl']]
+                }))
+        finally:
+            ledger.close()
+    else:
+        with open(path, newline="") as signals_file:
+            for record in csv.DictReader(signals_file):
+                if record.get('pair') and record['pair'].upper() != book.pair:
+                    continue
+                created_ts = parse_backtest_time(record['created_ts'])
+                entry_type = record['entry_type']
+                levels = LEVEL_ENGINE.levels(float(record['entry']), book.pair,
+                                             entry_type)
+                rows.append((created_ts, entry_type, {
+                    'entry': [levels['entry']],
+                    'tps': [levels['tps']],
+                    'sl': [levels['sl']]
+                }))
+    rows.sort(key=lambda row: row[0])
+    for created_ts, entry_type, levels in rows:
+        book.add(created_ts, entry_type, levels)
+    return len(rows)
+
+
+class BacktestGrid:
+    """Generates signals every `every` seconds for each entry type
+
+    A generated signal enters at the previous bar's close and is replayed from
+    the bar at its time on, so a bar's own range never decides its entry.
+    """
+
+    def __init__(self, pair, every, entry_types):
+        self.pair = pair
+        self.every = every
+        self.entry_types = entry_types
+        self._next_ts = None
+        self._last_close = None  # Close of the previous chunk's last bar
+
+    def entries(self, ts, close):
+        """(created_ts, entry price) arrays of the grid points in this chunk"""
+        if self._next_ts is None:
+            self._next_ts = ts[0] + self.every  # The first bar has no previous close
+        times = np.arange(self._next_ts, ts[-1] + 1e-9, self.every)
+        bars = np.searchsorted(ts, times, side="left")
+        previous = np.concatenate([[np.nan if self._last_close is None else
+                                     self._last_close], close[:-1]])[bars]
+        if len(times):
+            self._next_ts = times[-1] + self.every
+        self._last_close = close[-1]
+        return ts[bars], previous
+
+    def generate(self, book, ts, close):
+        """Add this chunk's grid signals to the book, before it is replayed"""
+        created, entries = self.entries(ts, close)
+        if len(created):
+            for entry_type in self.entry_types:
+                book.add(created, entry_type,
+                         LEVEL_ENGINE.levels_batch(entries, self.pair, entry_type))
+
+
+def run_backtest(argv):
+    """Command line entry point for `python main.py backtest`"""
+    parser = argparse.ArgumentParser(
+        prog="main.py backtest",
+        description="Replay a price history against past or generated signals")
+    parser.add_argument("prices", help=".npy or CSV price file (epoch seconds first column)")
+    parser.add_argument("--pair", required=True, help="Pair from PAIR_CONFIG")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--signals", help="CSV of past signals (created_ts,entry_type,entry)")
+    source.add_argument("--ledger", action="store_true",
+                        help="Replay the signals recorded in the signal ledger")
+    source.add_argument("--every", type=float,
+                        help="Generate a signal every N seconds at the bar price")
+    parser.add_argument("--entry-types", default="Buy,Sell",
+                        help="Entry types for generated signals (default Buy,Sell)")
+    parser.add_argument("--out", help="Write per-signal outcomes to this CSV file")
+    args = parser.parse_args(argv)
+
+    if not NUMPY_AVAILABLE:
+        print("❌ Backtesting requires NumPy - Install with: pip install numpy")
+        return 1
+    pair = args.pair.upper()
+    if pair not in PAIR_CONFIG:
+        print(f"❌ Unknown pair {pair}, add it to PAIR_CONFIG")
+        return 1
+
+    started = time.perf_counter()
+    book = BacktestBook(pair)
+    grid = None
+    if args.every:
+        grid = BacktestGrid(pair, args.every,
+                            [entry_type.strip() for entry_type in args.entry_types.split(",")])
+    else:
+        count = load_backtest_signals(book, args.signals, args.ledger)
+        print(f"📥 Loaded {count} {pair} signal(s)")
+
+    rows = 0
+    for ts, high, low, close in iter_price_chunks(args.prices):
+        if grid:
+            grid.generate(book, ts, close)
+        book.replay(ts, high, low)
+        rows += len(ts)
+    if not rows:
+        print(f"❌ No price rows in {args.prices}")
+        return 1
+
+    print(f"✅ Replayed {rows:,} price rows against {book.size:,} signal(s) "
+          f"in {time.perf_counter() - started:.1f}s")
+    if args.out:
+        book.write_outcomes(args.out)
+        print(f"✅ Per-signal outcomes written to {args.out}")
+    if book.size:
+        print(format_backtest_stats(f"{pair} backtest", book.aggregate()))
+    return 0
+
+
+def parse_sweep_values(spec):
+    """Expand '10-40/10,55' into [10, 20, 30, 40, 55]"""
+    values = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part[1:]:
+            bounds, _, step = part.partition("/")
+            low, _, high = bounds.partition("-")
+            low, high, step = float(low), float(high), float(step or 1)
+            values.extend(round(low + step * index, 6)
+                          for index in range(int((high - low) / step + 1e-9) + 1))
+        elif part:
+            values.append(float(part))
+    return values
+
+
+def sweep_candidates(tp_spec, sl_spec):
+    """Candidate (tps, sl) ladders: every increasing TP combination with every SL
+
+    tp_spec separates the values tried for each TP level with ';'.
+    """
+    tp_levels = [parse_sweep_values(level) for level in tp_spec.split(";")]
+    tp_sets = [tps for tps in itertools.product(*tp_levels)
+               if all(low < high for low, high in zip(tps, tps[1:]))]
+    return [(tps, sl) for tps in tp_sets for sl in parse_sweep_values(sl_spec)]
+
+
+def measure_move_unit(path, every, chunk_rows=BACKTEST_CHUNK_ROWS):
+    """Mean absolute close-to-close move per `every` seconds over a whole price file"""
+    total = 0.0
+    moves = 0
+    previous = next_ts = None
+    for ts, high, low, close in iter_price_chunks(path, chunk_rows):
+        if next_ts is None:
+            next_ts = ts[0]
+        count = int((ts[-1] - next_ts) // every) + 1 if ts[-1] >= next_ts else 0
+        if not count:
+            continue
+        times = next_ts + every * np.arange(count)
+        next_ts = times[-1] + every
+        steps = close[np.searchsorted(ts, times)]
+        if previous is not None:
+            steps = np.concatenate([[previous], steps])
+        total += float(np.abs(np.diff(steps)).sum())
+        moves += len(steps) - 1
+        previous = steps[-1]
+    return total / moves if moves else 0.0
+
+
+def sweep_pair(pair, path, candidates, every, entry_types, atr_units,
+               chunk_rows=BACKTEST_CHUNK_ROWS):
+    """Score every candidate ladder on one pair's history in a single replay
+
+    Each candidate gets its own copy of the grid signals, tagged with its
+    index, so one pass over the prices evaluates all of them. With atr_units
+    the distances are multiples of the pair's mean move per grid interval,
+    measured over the whole file first.
+    """
+    config = PAIR_CONFIG[pair]
+    book = BacktestBook(pair)
+    grid = BacktestGrid(pair, every, entry_types)
+    if atr_units:
+        unit = measure_move_unit(path, every, chunk_rows)
+        if not unit:
+            raise ValueError(f"{pair}: not enough history to measure its move per interval")
+        ladders = [{'mode': 'atr', 'atr': round(unit, config['decimals']),
+                    'tp': tps, 'sl': sl} for tps, sl in candidates]
+    else:
+        ladders = [{'mode': 'pips', 'tp': tps, 'sl': sl} for tps, sl in candidates]
+    compiled = [PairLadder(pair, config, ladder) for ladder in ladders]
+    rows = 0
+    for ts, high, low, close in iter_price_chunks(path, chunk_rows):
+        rows += len(ts)
+        created, entries = grid.entries(ts, close)
+        if len(created):
+            for group, ladder in enumerate(compiled):
+                for entry_type in entry_types:
+                    book.add(created, entry_type, LEVEL_ENGINE.levels_batch(
+                        entries, pair, entry_type, ladder=ladder), group)
+        book.replay(ts, high, low)
+
+    if not rows:
+        raise ValueError(f"no price rows in {path}")
+    closed, tp1_hits, sl_hits, breakevens, pips = book.aggregate_groups(len(ladders))
+    results = []
+    for group, ladder in enumerate(ladders):
+        trades = int(closed[group])
+        results.append({
+            'pair': pair,
+            'ladder': ladder,
+            'closed': trades,
+            'win_rate': tp1_hits[group] / trades if trades else 0.0,
+            'expectancy': pips[group] / trades if trades else 0.0,
+            'pips': float(pips[group]),
+            'sl_hits': int(sl_hits[group]),
+            'breakevens': int(breakevens[group])
+        })
+    return results
+
+
+def tidy_ladder(ladder):
+    """Ladder with whole numbers as ints and TPs as a tuple, as PAIR_CONFIG writes them"""
+
+    def number(value):
+        return int(value) if float(value).is_integer() else value
+
+    return dict(ladder, tp=tuple(number(tp) for tp in ladder['tp']),
+                sl=number(ladder['sl']))
+
+
+def format_ladder(ladder):
+    """PAIR_CONFIG literal for a ladder, e.g. {'mode': 'pips', 'tp': (20, 50, 100), 'sl': 70}"""
+    return repr(tidy_ladder(ladder))
+
+
+def run_sweep(argv):
+    """Command line entry point for `python main.py sweep`"""
+    parser = argparse.ArgumentParser(
+        prog="main.py sweep",
+        description="Rank candidate TP/SL ladders per pair on historical prices")
+    parser.add_argument("prices", nargs="+",
+                        help="PAIR=path or <PAIR>.npy/<PAIR>.csv price files")
+    parser.add_argument("--tp", default="10-40/10;30-90/20;60-200/40",
+                        help="Values per TP level, levels separated by ';' (ranges as lo-hi/step)")
+    parser.add_argument("--sl", default="30-120/15", help="SL values to try")
+    parser.add_argument("--atr", action="store_true",
+                        help="Values are multiples of the pair's mean move per interval instead of pips")
+    parser.add_argument("--every", type=float, default=4 * 3600,
+                        help="Seconds between generated signals (default 4 hours)")
+    parser.add_argument("--entry-types", default="Buy,Sell")
+    parser.add_argument("--min-trades", type=int, default=30,
+                        help="Closed signals a ladder needs to be ranked")
+    parser.add_argument("--top", type=int, default=10, help="Ladders shown per pair")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--report", help="Write every scored ladder to this CSV file")
+    parser.add_argument("--export", help="Write the best ladder per pair to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not NUMPY_AVAILABLE:
+        print("❌ Sweeps require NumPy - Install with: pip install numpy")
+        return 1
+    files = {}
+    for spec in args.prices:
+        pair, separator, path = spec.partition("=")
+        if not separator:
+            path = spec
+            pair = os.path.splitext(os.path.basename(spec))[0]
+        pair = pair.upper()
+        if pair not in PAIR_CONFIG:
+            print(f"❌ Unknown pair {pair}, add it to PAIR_CONFIG")
+            return 1
+        files[pair] = path
+    candidates = sweep_candidates(args.tp, args.sl)
+    entry_types = [entry_type.strip() for entry_type in args.entry_types.split(",")]
+    print(f"🔍 Sweeping {len(candidates)} ladder(s) over {len(files)} pair(s) "
+          f"with {min(args.workers, len(files))} worker(s)")
+
+    started = time.perf_counter()
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(args.workers, len(files))) as executor:
+        futures = {
+            executor.submit(sweep_pair, pair, path, candidates, args.every,
+                            entry_types, args.atr): pair
+            for pair, path in files.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            pair = futures[future]
+            try:
+                results[pair] = future.result()
+                print(f"✅ {pair} scored ({time.perf_counter() - started:.1f}s)")
+            except Exception as e:
+                print(f"❌ {pair} failed: {str(e)}")
+
+    best = {}
+    for pair in sorted(results):
+        ranked = sorted(
+            (row for row in results[pair] if row['closed'] >= args.min_trades),
+            key=lambda row: (row['expectancy'], row['win_rate']), reverse=True)
+        print(f"\n📊 {pair}: {len(ranked)} of {len(results[pair])} ladder(s) "
+              f"with at least {args.min_trades} closed signals")
+        for rank, row in enumerate(ranked[:args.top], start=1):
+            print(f"  {rank:>2}. {format_ladder(row['ladder'])}  "
+                  f"win {row['win_rate'] * 100:.0f}%  "
+                  f"expectancy {row['expectancy']:+.1f} pips  "
+                  f"breakeven {row['breakevens']}  "
+                  f"closed {row['closed']}")
+        if ranked:
+            best[pair] = tidy_ladder(ranked[0]['ladder'])
+
+    if best:
+        print("\nProposed PAIR_CONFIG ladders:")
+        for pair, ladder in best.items():
+            print(f"    '{pair}': {{..., 'ladder': {format_ladder(ladder)}}},")
+    if args.report:
+        with open(args.report, "w", newline="") as report_file:
+            writer = csv.writer(report_file)
+            writer.writerow(["pair", "ladder", "closed", "win_rate",
+                             "expectancy_pips", "pips", "sl_hits", "breakevens"])
+            for pair in sorted(results):
+                for row in results[pair]:
+                    writer.writerow([pair, format_ladder(row['ladder']), row['closed'],
+                                     round(row['win_rate'], 4),
+                                     round(row['expectancy'], 2),
+                                     round(row['pips'], 1), row['sl_hits'],
+                                     row['breakevens']])
+        print(f"✅ Full report written to {args.report}")
+    if args.export:
+        with open(args.export, "w") as export_file:
+            json.dump(best, export_file, indent=2)
+        print(f"✅ Proposed ladders written to {args.export}")
+    return 0
 
 
 # Web server for health checks
@@ -1349,8 +4880,17 @@ async def web_server():
             "status": "running",
             "bot_status": bot_status,
             "guild_count": guild_count,
+            "shard_count": bot.shard_count,
+            "auto_role_guilds": sum(
+                1 for guild_id in GUILD_AUTO_ROLE_CONFIGS
+                if is_auto_role_enabled(guild_id)),
             "uptime": str(datetime.now()),
-            "version": "2.0"
+            "version": "2.0",
+            "join_queue_depth": bot.join_pipeline.depth,
+            "join_drain_rate_per_min": round(bot.join_pipeline.drain_rate(), 1),
+            "expiry_backlog": bot.expiry_executor.backlog,
+            "expiry_planned_drain_time":
+            bot.expiry_executor.planned_drain_time().isoformat()
         }
 
         return web.json_response(response_data, status=200)
@@ -1442,15 +4982,38 @@ async def main():
     bot_task = asyncio.create_task(start_bot_with_retry())
     tasks.append(bot_task)
 
+    # Treat SIGTERM (sent by Render/Heroku on redeploy) like a normal shutdown
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: [task.cancel() for task in tasks])
+    except NotImplementedError:
+        pass  # Signal handlers are not supported on this platform
+
     # Wait for all tasks
     try:
         await asyncio.gather(*tasks, return_exceptions=True)
     except KeyboardInterrupt:
         print("Shutting down...")
-        await bot.close()
+    finally:
+        # Disconnect first so no new events queue work while the workers wind down
+        if not bot.is_closed():
+            await bot.close()
+        await bot.join_pipeline.stop()
+        await bot.expiry_executor.stop()
+        await bot.dm_outbox.stop()
+        await bot.outcome_tracker.stop()
+        # Flush pending auto-role state and signals, then close the stores
+        await bot.persistence.stop()
+        await asyncio.to_thread(bot.state_store.close)
+        await bot.signal_recorder.stop()
+        await asyncio.to_thread(bot.signal_ledger.close)
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["backtest"]:
+        sys.exit(run_backtest(sys.argv[2:]))
+    if sys.argv[1:2] == ["sweep"]:
+        sys.exit(run_sweep(sys.argv[2:]))
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
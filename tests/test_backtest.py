@@ -0,0 +1,72 @@
+"""Vectorized backtest replay checked against a bar-by-bar reference"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def reference_outcome(ts, high, low, created, entry, is_buy, tps, sl):
+    """Walk the bars one at a time with the ledger rules; returns (best_tp, sl_hit, breakeven)"""
+    best = 0
+    for bar in range(np.searchsorted(ts, created), len(ts)):
+        if is_buy:
+            stop_hit = low[bar] <= (sl if best == 0 else entry)
+            reached = sum(high[bar] >= tp for tp in tps)
+        else:
+            stop_hit = high[bar] >= (sl if best == 0 else entry)
+            reached = sum(low[bar] <= tp for tp in tps)
+        if stop_hit:
+            return best, best == 0, best > 0
+        best = max(best, reached)
+        if best == len(tps):
+            break
+    return best, False, False
+
+
+def random_walk(seed, bars):
+    rng = np.random.default_rng(seed)
+    ts = np.arange(bars) * 60.0 + 1.7e9
+    close = 1.1 + np.cumsum(rng.normal(0, 0.00015, bars))
+    high = close + np.abs(rng.normal(0, 0.0001, bars))
+    low = close - np.abs(rng.normal(0, 0.0001, bars))
+    return ts, high, low, close
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_replay_matches_reference(seed):
+    ts, high, low, close = random_walk(seed, 20000)
+    book = main.BacktestBook("EURUSD")
+    book.MAX_SEGMENT = 1024  # Exercise segment splits inside a chunk
+    grid = main.BacktestGrid("EURUSD", 1800, ["Buy", "Sell"])
+    for start in range(0, len(ts), 3000):
+        chunk = slice(start, start + 3000)
+        grid.generate(book, ts[chunk], close[chunk])
+        book.replay(ts[chunk], high[chunk], low[chunk])
+
+    assert book.size > 500
+    for row in range(book.size):
+        expected = reference_outcome(ts, high, low, book.created[row], book.entry[row],
+                                     book.is_buy[row], book.tps[row, :book.tp_count[row]],
+                                     book.sl[row])
+        actual = (book.best_tp[row], not np.isnan(book.sl_ts[row]),
+                  not np.isnan(book.breakeven_ts[row]))
+        assert actual == expected, row
+
+
+def test_stop_after_tp1_closes_at_breakeven():
+    # Buy at 2000: TP1 at 2002, then below the SL, then past TP3
+    ts = np.array([0.0, 60.0, 120.0, 180.0])
+    price = np.array([2000.0, 2002.0, 1900.0, 2010.0])
+    book = main.BacktestBook("XAUUSD")
+    book.add(0.0, "Buy", main.LEVEL_ENGINE.levels_batch([2000.0], "XAUUSD", "Buy"))
+    book.replay(ts, price, price)
+
+    stats = book.aggregate()
+    assert stats['tp_hits'] == [1, 0, 0]
+    assert stats['sl'] == 0 and stats['breakeven'] == 1
+    assert stats['pips'] == pytest.approx(20.0)
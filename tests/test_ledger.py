@@ -0,0 +1,80 @@
+"""Signal ledger outcome rules and the day buckets /stats sums"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+CREATED = datetime(2026, 9, 1, 12, 0, tzinfo=main.AMSTERDAM_TZ).timestamp()
+DAY = datetime(2026, 9, 1).date()
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = main.SignalLedger(str(tmp_path / "ledger.db"))
+    ledger.open()
+    yield ledger
+    ledger.close()
+
+
+def record(ledger, entry_type="Buy execution"):
+    """Insert a XAUUSD signal at 2000 (TPs 20/50/100 pips, SL 70 pips); returns its id"""
+    levels = main.LEVEL_ENGINE.levels(2000.0, "XAUUSD", entry_type)
+    is_buy, _ = main.parse_entry_type(entry_type)
+    return ledger.record_batch([{
+        'created_ts': CREATED, 'guild_id': 1, 'author_id': 2, 'pair': "XAUUSD",
+        'entry_type': entry_type, 'is_buy': is_buy, 'entry': levels['entry'],
+        'sl': levels['sl'], 'tps': levels['tps'], 'messages': {10: 20},
+        'content': "signal"
+    }])[0]
+
+
+def hit(ledger, signal_id, *outcomes):
+    ledger.record_batch([], [(signal_id, outcome, CREATED + 60, None)
+                             for outcome in outcomes])
+
+
+def test_sl_after_tp1_closes_at_breakeven(ledger):
+    signal_id = record(ledger)
+    hit(ledger, signal_id, "tp1", "sl", "tp3")
+
+    stats = ledger.aggregate(DAY, DAY)
+    assert stats['tp_hits'] == [1]
+    assert stats['sl'] == 0 and stats['breakeven'] == 1
+    assert stats['closed'] == 1 and stats['open'] == 0
+    assert stats['pips'] == pytest.approx(20.0)
+    assert ledger.open_signals() == []
+
+
+def test_sl_before_any_tp_is_a_loss(ledger):
+    signal_id = record(ledger, "Sell execution")
+    hit(ledger, signal_id, "sl", "tp1")
+
+    stats = ledger.aggregate(DAY, DAY)
+    assert stats['tp_hits'] == [] and stats['sl'] == 1
+    assert stats['breakeven'] == 0
+    assert stats['pips'] == pytest.approx(-70.0)
+
+
+def test_breakeven_without_a_tp_is_ignored(ledger):
+    signal_id = record(ledger)
+    hit(ledger, signal_id, "breakeven")
+
+    stats = ledger.aggregate(DAY, DAY)
+    assert stats['breakeven'] == 0 and stats['open'] == 1
+    assert [signal['id'] for signal in ledger.open_signals()] == [signal_id]
+
+
+def test_tps_only_move_forward_and_the_last_one_closes(ledger):
+    signal_id = record(ledger)
+    hit(ledger, signal_id, "tp2", "tp1", "tp3", "sl")
+
+    stats = ledger.aggregate(DAY, DAY)
+    assert stats['tp_hits'] == [1, 1, 1]
+    assert stats['sl'] == 0 and stats['breakeven'] == 0
+    assert stats['pips'] == pytest.approx(100.0)
+    assert ledger.open_signals() == []
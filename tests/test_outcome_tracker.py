@@ -0,0 +1,65 @@
+"""Outcome tracker threshold crossings, including the stop moving to entry after TP1"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+class Recorder:
+    """Collects the outcomes the tracker would queue for the ledger"""
+
+    def __init__(self):
+        self.outcomes = []
+
+    def record_outcome(self, signal_id, outcome, hit_ts=None, price=None):
+        self.outcomes.append((signal_id, outcome))
+
+
+def tracker_with(*signals):
+    tracker = main.OutcomeTracker(Recorder())
+    for signal_id, entry_type, best_tp in signals:
+        levels = main.LEVEL_ENGINE.levels(2000.0, "XAUUSD", entry_type)
+        tracker.add_signal(dict(levels, id=signal_id, pair="XAUUSD", best_tp=best_tp,
+                                is_buy=main.parse_entry_type(entry_type)[0]))
+    return tracker
+
+
+def thresholds(tracker):
+    return tracker._rising["XAUUSD"] + tracker._falling["XAUUSD"]
+
+
+def test_stop_moves_to_entry_after_tp1():
+    # Buy at 2000: TPs 2002/2005/2010, SL 1993
+    tracker = tracker_with((1, "Buy execution", 0))
+    assert tracker.process_tick("XAUUSD", 2002.0, 1) == [(1, "tp1")]
+    assert (1993.0, 1, "sl") not in thresholds(tracker)
+    assert tracker.process_tick("XAUUSD", 1990.0, 2) == [(1, "breakeven")]
+    assert len(tracker) == 0 and thresholds(tracker) == []
+    assert tracker.process_tick("XAUUSD", 2010.0, 3) == []
+
+
+def test_sl_before_tp1_closes_the_signal():
+    # Sell at 2000: TPs 1998/1995/1990, SL 2007
+    tracker = tracker_with((1, "Sell execution", 0))
+    assert tracker.process_tick("XAUUSD", 2007.0, 1) == [(1, "sl")]
+    assert len(tracker) == 0 and thresholds(tracker) == []
+    assert tracker.recorder.outcomes == [(1, "sl")]
+
+
+def test_one_tick_can_cross_several_tps():
+    tracker = tracker_with((1, "Sell execution", 0), (2, "Buy execution", 0))
+    assert tracker.process_tick("XAUUSD", 1995.0, 1) == [(1, "tp1"), (1, "tp2")]
+    # Back at the sell's entry: closed at breakeven, the buy is untouched
+    assert tracker.process_tick("XAUUSD", 2000.0, 2) == [(1, "breakeven")]
+    assert tracker.process_tick("XAUUSD", 2011.0, 3) == [(2, "tp1"), (2, "tp2"), (2, "tp3")]
+    assert len(tracker) == 0 and thresholds(tracker) == []
+
+
+def test_signal_loaded_after_tp1_tracks_breakeven():
+    tracker = tracker_with((1, "Buy execution", 1))
+    assert (2000.0, 1, "breakeven") in thresholds(tracker)
+    assert tracker.process_tick("XAUUSD", 2002.0, 1) == []
+    assert tracker.process_tick("XAUUSD", 2005.0, 2) == [(1, "tp2")]
+    assert tracker.process_tick("XAUUSD", 1999.0, 3) == [(1, "breakeven")]